@@ -0,0 +1,163 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import select
+import logging
+import time
+
+DEFAULT_POLL_INTERVAL = 30
+
+# kqueue vnode events that mean the watched file or directory content was changed
+_KQ_VNODE_FLAGS = ["NOTE_WRITE", "NOTE_EXTEND", "NOTE_ATTRIB", "NOTE_DELETE", "NOTE_RENAME"]
+
+class ChangeWatcher(object):
+
+    def __init__(self, groups_dir, users_dir, session_files = (), interval = DEFAULT_POLL_INTERVAL):
+
+        '''
+         Watch the OpenDirectory groups and users folders and the session files for changes.
+         On macOS the watcher sleeps on kqueue vnode events, elsewhere (or if kqueue fails) it falls back to
+         polling every interval seconds. In both cases the changes are found by comparing file mtimes, kqueue only
+         saves the wakeups while nothing happens.
+        '''
+
+        self._groups_dir = groups_dir
+        self._users_dir = users_dir
+        self._session_files = list(session_files)
+        self._interval = interval
+        self._use_kqueue = hasattr(select, "kqueue")
+
+        self._groups_snapshot = self._snapshot_folder(self._groups_dir)
+        self._users_snapshot = self._snapshot_folder(self._users_dir)
+        self._sessions_snapshot = self._snapshot_files(self._session_files)
+
+    def wait_for_changes(self):
+
+        '''
+         Block until something changed and return the changes in the following format:
+         {"groups": set of changed group names, "users": set of changed user names, "sessions": True if a session file changed}
+         Returns None if the wait expired without any change.
+        '''
+
+        if self._use_kqueue:
+            self._wait_kqueue()
+        else:
+            time.sleep(self._interval)
+
+        groups_snapshot = self._snapshot_folder(self._groups_dir)
+        users_snapshot = self._snapshot_folder(self._users_dir)
+        sessions_snapshot = self._snapshot_files(self._session_files)
+
+        changes = {"groups": self._diff_snapshots(self._groups_snapshot, groups_snapshot),
+                   "users": self._diff_snapshots(self._users_snapshot, users_snapshot),
+                   "sessions": sessions_snapshot != self._sessions_snapshot}
+
+        self._groups_snapshot = groups_snapshot
+        self._users_snapshot = users_snapshot
+        self._sessions_snapshot = sessions_snapshot
+
+        if not changes["groups"] and not changes["users"] and not changes["sessions"]:
+            return None
+
+        logging.debug("Detected changes - groups: {0}, users: {1}, sessions: {2}".format(changes["groups"], changes["users"], changes["sessions"]))
+        return changes
+
+    def _wait_kqueue(self):
+
+        '''
+         Register vnode events on the folders and the session files and wait for the first one (or the interval).
+         The descriptors are opened on every wait as OpenDirectory and the login process replace the files instead of
+         writing them in place.
+        '''
+
+        fds = []
+        kq = None
+        try:
+            kq = select.kqueue()
+            flags = 0
+            for flag_name in _KQ_VNODE_FLAGS:
+                flags |= getattr(select, "KQ_" + flag_name, 0)
+
+            events = []
+            for path in [self._groups_dir, self._users_dir] + self._session_files:
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                except OSError:
+                    logging.debug("Cannot watch {0}".format(path))
+                    continue
+                fds.append(fd)
+                events.append(select.kevent(fd, filter=select.KQ_FILTER_VNODE, flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR, fflags=flags))
+
+            kq.control(events, 1, self._interval)
+
+        except OSError as e:
+            logging.warning("kqueue notification failed ({0}), falling back to mtime polling".format(e))
+            self._use_kqueue = False
+            time.sleep(self._interval)
+
+        finally:
+            for fd in fds:
+                os.close(fd)
+            if kq is not None:
+                kq.close()
+
+    @staticmethod
+    def _diff_snapshots(old_snapshot, new_snapshot):
+
+        # Added, removed or modified record names
+        return {name for name in old_snapshot.keys() | new_snapshot.keys() if old_snapshot.get(name) != new_snapshot.get(name)}
+
+    @staticmethod
+    def _snapshot_folder(folder_path):
+
+        '''
+         Map every plist in the folder to its modification time and size in the following format
+         {name of the plistfile : (mtime, size)}
+        '''
+
+        snapshot = dict()
+        try:
+            entries = os.scandir(folder_path)
+        except OSError as e:
+            logging.warning("Cannot list folder {0} - {1}".format(folder_path, e))
+            return snapshot
+
+        with entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                snapshot[os.path.splitext(entry.name)[0]] = (stat.st_mtime_ns, stat.st_size)
+
+        return snapshot
+
+    @staticmethod
+    def _snapshot_files(file_paths):
+
+        snapshot = dict()
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                snapshot[file_path] = None
+                continue
+            snapshot[file_path] = (stat.st_mtime_ns, stat.st_size)
+
+        return snapshot
@@ -26,40 +26,79 @@ import json
 import time
 import sys
 import subprocess
+import concurrent.futures
 import SystemLib
+import MacHoundModel
 
 OD_MAIN_FOLDER = r"/var/db/dslocal/nodes/Default"
 OD_GROUPS_FOLDER = os.path.join(OD_MAIN_FOLDER,"groups")
 OD_USERS_FOLDER = os.path.join(OD_MAIN_FOLDER,"users")
 
+# Below this number of plist files the process pool start-up costs more than parallel decoding saves
+# Provisional values, to be set from benchmarks/bench_parallel.py on a multi-core Mac
+PARALLEL_THRESHOLD = 2000
+PARALLEL_CHUNK_SIZE = 256
+
+def _decode_plist_chunk(record_class, folder_path, file_names):
+
+    '''
+     Decode a chunk of plist files in a worker process.
+     Only the trimmed records are sent back, not the full plist content.
+    '''
+
+    records = []
+    for file_name in file_names:
+        record_name = os.path.splitext(file_name)[0]
+        with open(os.path.join(folder_path, file_name),'rb') as fp:
+            records.append((record_name, record_class.from_plist(record_name, plistlib.load(fp))))
+    return records
+
 class GroupParser(object):
 
-    def __init__(self, system_lib = SystemLib.SystemLib(), groups_dir = OD_GROUPS_FOLDER, users_dir = OD_GROUPS_FOLDER):
+    def __init__(self, system_lib = None, groups_dir = OD_GROUPS_FOLDER, users_dir = OD_USERS_FOLDER, workers = None, parallel_threshold = PARALLEL_THRESHOLD):
         
         '''
          Create the users and groups dictionaries. This are stored as:
-         group/user name : dictionary of the plist content
+         group/user name : UserRecord/GroupRecord holding the used fields of the plist content
          The name is the file name as found in the OpenDirectory database folder
+         The records are also indexed by their GUIDs
+         With more than one worker, large OD folders are decoded across a process pool
         '''
         self._users_dict = dict()
         self._groups_dict = dict()
-        self._system_lib = system_lib
+        self._users_by_guid = dict()
+        self._groups_by_guid = dict()
+        self._system_lib = system_lib if system_lib is not None else SystemLib.SystemLib()
+        self._groups_dir = groups_dir
+        self._users_dir = users_dir
 
         # Get all users and group
         try:
-            self._parse_groups(groups_dir)
-            self._parse_users(users_dir)
+            if workers and workers > 1:
+                self._parse_parallel(groups_dir, users_dir, workers, parallel_threshold)
+            else:
+                self._parse_groups(groups_dir)
+                self._parse_users(users_dir)
         except PermissionError:
             logging.error("MacHound requires root permissions for execution. Please re-run the tools with root privileges")
             raise PermissionError("MacHound requires root permissions for execution. Please re-run the tools with root privileges") from None
         
-    def get_all_group_members(self, group_plist):
+    def get_all_group_members(self, group_record, dependencies = None):
+
+        '''
+         Resolve the direct and nested members of the group.
+         If a dependencies set is given, every GUID looked up while resolving the group (the group itself,
+         its members and nested groups) is added to it, so callers can tell which records the result depends on.
+        '''
 
         logging.debug("get_all_group_members started")
 
+        if dependencies is not None:
+            dependencies.update(group_record.guids)
+
         # Contains the names of the local users who are members (direct or nested) of the group
         group_members = []
-        activedirectory_sids = []
+        activedirectory_sids = set()
 
         # Get group direct members
         # Direct group members are stored under the 'groupmembers' property of the plist file.
@@ -68,28 +107,30 @@ class GroupParser(object):
         # Mobile users are treated as local users as their password can be out of sync from the Active Directory, for now we dont handle them
         # For remote users, the GUID is taken from the Active Directory. The value is stored under the 'objectGUID' property of the user in the Active Directory scheme.
         
-        if 'groupmembers' in group_plist:
-            direct_members = group_plist['groupmembers']
-            for user_guid in direct_members:
-                username = self.get_user_by_guid(user_guid)
-
-                if username:
-                    logging.debug("Found user name - {0}".format(username['name'][0]))
-
-                    # Check if the user has the original_node_name, which how we identify mobile.
-                    if "original_node_name" in username.keys():
-                        logging.debug("Identified Mobile user, probably Domain User from {0}".format(username['original_node_name']))
-                        user_sid = self._system_lib.uuid_to_sid(user_guid)
-                        activedirectory_sids.append({"MemberId":user_sid,"MemberType":"User"})
-                    
-                    # Appen the name of the local user to the local users list
-                    group_members.append(username['name'][0])
-
-                else:
-                    # This is probably an active directory user, should save this and test it against the AD.
-                    logging.debug("Identified possible Network user - {0}".format(user_guid))
+        for user_guid in group_record.members:
+            if dependencies is not None:
+                dependencies.add(user_guid)
+            username = self.get_user_by_guid(user_guid)
+
+            if username:
+                logging.debug("Found user name - {0}".format(username.name))
+
+                # Check if the user has the original_node_name, which how we identify mobile.
+                if username.is_mobile:
+                    logging.debug("Identified Mobile user, probably Domain User from {0}".format(username.original_node_name))
                     user_sid = self._system_lib.uuid_to_sid(user_guid)
-                    activedirectory_sids.append({"MemberId":user_sid,"MemberType":"User"})
+                    if user_sid:
+                        activedirectory_sids.add(MacHoundModel.Member(user_sid, MacHoundModel.MemberType.USER))
+                
+                # Appen the name of the local user to the local users list
+                group_members.append(username.name)
+
+            else:
+                # This is probably an active directory user, should save this and test it against the AD.
+                logging.debug("Identified possible Network user - {0}".format(user_guid))
+                user_sid = self._system_lib.uuid_to_sid(user_guid)
+                if user_sid:
+                    activedirectory_sids.add(MacHoundModel.Member(user_sid, MacHoundModel.MemberType.USER))
 
         # Get group nested members
         # Nested groups are stored under the 'nestedgroups' property of the plist file.
@@ -97,31 +138,33 @@ class GroupParser(object):
         # Local groups can be identified as they have a plist file, remote groups have none.
         # For remote groups, the GUID is taken from the Active Directory. The value is stored under the 'objectGUID' property of the group in the Active Directory scheme.
 
-        if 'nestedgroups' in group_plist:
-            nested_groups = group_plist['nestedgroups']
-            logging.debug("Identifying {0} nested groups".format(len(group_plist['nestedgroups'])))
-
-            for nestedgroup_guid in nested_groups:
-                group_instance = self.get_group_by_guid(nestedgroup_guid)
-                if group_instance:
-                    # Recursions are fun. This PoC does not test if there are loops and infinite recursions in the groups.
-                    nestedgroup_members = self.get_all_group_members(group_instance)
-                    if nestedgroup_members:
-                        group_members+= nestedgroup_members['local']
-                        activedirectory_sids+=nestedgroup_members['activedirectory_sids']
-
-                else:
-                    # This is probably an Active Directory group, should save this and test it against the AD.
-                    logging.debug("Unknown group, probably Domain Group - {0}".format(nestedgroup_guid))
-                    group_sid = self._system_lib.uuid_to_sid(nestedgroup_guid)
-                    activedirectory_sids.append({"MemberId":group_sid,"MemberType":"Group"})
+        if group_record.nested_groups:
+            logging.debug("Identifying {0} nested groups".format(len(group_record.nested_groups)))
+
+        for nestedgroup_guid in group_record.nested_groups:
+            if dependencies is not None:
+                dependencies.add(nestedgroup_guid)
+            group_instance = self.get_group_by_guid(nestedgroup_guid)
+            if group_instance:
+                # Recursions are fun. This PoC does not test if there are loops and infinite recursions in the groups.
+                nestedgroup_members = self.get_all_group_members(group_instance, dependencies)
+                if nestedgroup_members:
+                    group_members+= nestedgroup_members['local']
+                    activedirectory_sids.update(nestedgroup_members['activedirectory_sids'])
+
+            else:
+                # This is probably an Active Directory group, should save this and test it against the AD.
+                logging.debug("Unknown group, probably Domain Group - {0}".format(nestedgroup_guid))
+                group_sid = self._system_lib.uuid_to_sid(nestedgroup_guid)
+                if group_sid:
+                    activedirectory_sids.add(MacHoundModel.Member(group_sid, MacHoundModel.MemberType.GROUP))
         logging.debug("get_all_group_members completed")
         return {"local":group_members, "activedirectory_sids":activedirectory_sids}
 
     def get_user_by_name(self, user_name):
         
         '''
-         Get the user plist value from the scheme as parsed from the OD folder.
+         Get the user record from the scheme as parsed from the OD folder.
         
         '''
 
@@ -134,23 +177,19 @@ class GroupParser(object):
     def get_user_by_guid(self, user_guid):
 
         '''
-         Get the user plist values from the scheme as parsed from the OD folder
-         The GUID is stored as a property in the plist and therfore we have to iterate all dict members
-         Its possible to index it better for performance
-        
+         Get the user record from the scheme as parsed from the OD folder, using the GUID index
         '''
 
-        for user_name in self._users_dict:
-            if user_guid in self._users_dict[user_name]['generateduid']:
-                return self._users_dict[user_name]
+        if not user_guid in self._users_by_guid:
+            logging.warning("User GUID {0} was not found".format(user_guid))
+            return None
 
-        logging.warning("User GUID {0} was not found".format(user_guid))
-        return None
+        return self._users_by_guid[user_guid]
 
     def get_group_by_name(self, group_name):
 
         '''
-         Get the group plist value from the scheme as parsed from the OD folder.
+         Get the group record from the scheme as parsed from the OD folder.
         '''
         
         if not group_name in self._groups_dict:
@@ -162,16 +201,66 @@ class GroupParser(object):
     def get_group_by_guid(self, group_guid):
 
         '''
-         Get the group plist values from the scheme as parsed from the OD folder
-         The GUID is stored as a property in the plist and therfore we have to iterate all dict members
-         Its possible to index it better for performance
+         Get the group record from the scheme as parsed from the OD folder, using the GUID index
         '''
         
-        for group_name in self._groups_dict:
-            if group_guid in self._groups_dict[group_name]['generateduid']:
-                return self._groups_dict[group_name]
-        logging.warning("Group GUID {0} was not found".format(group_guid))
-        return None
+        if not group_guid in self._groups_by_guid:
+            logging.warning("Group GUID {0} was not found".format(group_guid))
+            return None
+
+        return self._groups_by_guid[group_guid]
+
+    def reload_users(self, user_names):
+
+        '''
+         Re-read the plist files of the given users from the OD folder, dropping users whose file was removed.
+         Returns the GUIDs of the changed users, both before and after the reload.
+        '''
+
+        return self._reload_records(self._users_dict, self._users_by_guid, MacHoundModel.UserRecord, self._users_dir, user_names)
+
+    def reload_groups(self, group_names):
+
+        '''
+         Re-read the plist files of the given groups from the OD folder, dropping groups whose file was removed.
+         Returns the GUIDs of the changed groups, both before and after the reload.
+        '''
+
+        return self._reload_records(self._groups_dict, self._groups_by_guid, MacHoundModel.GroupRecord, self._groups_dir, group_names)
+
+    def _reload_records(self, records_dict, guid_index, record_class, records_path, record_names):
+
+        changed_guids = set()
+
+        for record_name in record_names:
+            if record_name in records_dict:
+                old_record = records_dict.pop(record_name)
+                changed_guids.update(old_record.guids)
+                for guid in old_record.guids:
+                    if guid_index.get(guid) is old_record:
+                        del guid_index[guid]
+
+            plist_path = os.path.join(records_path, record_name + ".plist")
+            if not os.path.exists(plist_path):
+                logging.debug("Record {0} was removed".format(record_name))
+                continue
+
+            record_plist = self._parse_plist_file(plist_path)
+            if record_plist is None:
+                continue
+
+            record = self._add_record(records_dict, guid_index, record_name, record_class.from_plist(record_name, record_plist))
+            changed_guids.update(record.guids)
+
+        return changed_guids
+
+    @staticmethod
+    def _add_record(records_dict, guid_index, record_name, record):
+
+        records_dict[record_name] = record
+        for guid in record.guids:
+            guid_index[guid] = record
+        return record
 
     def _parse_plist_file(self, plist_path):
 
@@ -189,27 +278,68 @@ class GroupParser(object):
 
         return pl
 
+    def _list_plist_files(self, folder_path):
+
+        '''
+         List the plist file names stored under an OD scheme folder.
+        '''
+
+        return os.listdir(folder_path)
+
     def _parse_users(self, users_path):
         '''
          Parses all plist files stored under the users directory in the OD scheme.
          The users are stored in a dictionary in the following format
-         {name of the plistfile : plist dictionary}
+         {name of the plistfile : UserRecord}
         '''
         logging.debug("_parse_users started")
-        for user_plist_path in os.listdir(users_path):
+        for user_plist_path in self._list_plist_files(users_path):
             username = os.path.splitext(user_plist_path)[0]
-            self._users_dict[username] = self._parse_plist_file(os.path.join(users_path,user_plist_path))
+            user_plist = self._parse_plist_file(os.path.join(users_path,user_plist_path))
+            self._add_record(self._users_dict, self._users_by_guid, username, MacHoundModel.UserRecord.from_plist(username, user_plist))
         logging.debug("_parse_users completed")
 
+    def _parse_parallel(self, groups_path, users_path, workers, parallel_threshold):
+        '''
+         Parses the groups and users plist files in chunks across a process pool.
+         The records are added in the same order as the serial parsing, so the result is identical.
+         Falls back to serial parsing for folders smaller than the threshold.
+        '''
+
+        group_files = self._list_plist_files(groups_path)
+        user_files = self._list_plist_files(users_path)
+        if len(group_files) + len(user_files) < parallel_threshold:
+            logging.debug("{0} plist files are below the parallel threshold, parsing serially".format(len(group_files) + len(user_files)))
+            self._parse_groups(groups_path)
+            self._parse_users(users_path)
+            return
+
+        logging.debug("_parse_parallel started with {0} workers".format(workers))
+        with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+            group_futures = [executor.submit(_decode_plist_chunk, MacHoundModel.GroupRecord, groups_path, group_files[i:i + PARALLEL_CHUNK_SIZE])
+                             for i in range(0, len(group_files), PARALLEL_CHUNK_SIZE)]
+            user_futures = [executor.submit(_decode_plist_chunk, MacHoundModel.UserRecord, users_path, user_files[i:i + PARALLEL_CHUNK_SIZE])
+                            for i in range(0, len(user_files), PARALLEL_CHUNK_SIZE)]
+
+            for future in group_futures:
+                for group_name, group_record in future.result():
+                    self._add_record(self._groups_dict, self._groups_by_guid, group_name, group_record)
+
+            for future in user_futures:
+                for username, user_record in future.result():
+                    self._add_record(self._users_dict, self._users_by_guid, username, user_record)
+        logging.debug("_parse_parallel completed")
+
     def _parse_groups(self, group_path):
         '''
-         Parses all plist files stored under the users directory in the OD scheme.
-         The users are stored in a dictionary in the following format
-         {name of the plistfile : plist dictionary}
+         Parses all plist files stored under the groups directory in the OD scheme.
+         The groups are stored in a dictionary in the following format
+         {name of the plistfile : GroupRecord}
         '''
 
         logging.debug("_parse_groups started")
-        for group_plist_path in os.listdir(group_path):
+        for group_plist_path in self._list_plist_files(group_path):
             group_name = os.path.splitext(group_plist_path)[0]
-            self._groups_dict[group_name] = self._parse_plist_file(os.path.join(group_path,group_plist_path))
-        logging.debug("_parse_groups completed")
\ No newline at end of file
+            group_plist = self._parse_plist_file(os.path.join(group_path,group_plist_path))
+            self._add_record(self._groups_dict, self._groups_by_guid, group_name, MacHoundModel.GroupRecord.from_plist(group_name, group_plist))
+        logging.debug("_parse_groups completed")
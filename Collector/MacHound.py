@@ -18,10 +18,16 @@
 
 import GroupParser
 import SystemLib
+import MacHoundModel
+import ChangeWatcher
 import logging
 import json
+import plistlib
 import subprocess
 import codecs
+import hashlib
+import time
+import os
 
 ADMIN_GROUPS = {"AdminTo":"admin",
                 "CanSSH":"com.apple.access_ssh",
@@ -30,33 +36,60 @@ ADMIN_GROUPS = {"AdminTo":"admin",
 
 class MacHound():
 
-    def __init__(self, edges_to_parse = ('HasSession','AdminTo','CanVNC','CanAE'),output_path = "./output.json"):
-        
-        # Init the System library wrapping class
-        self._system_lib = SystemLib.SystemLib()
-        
-        # initiate the local OpenDirectory Parser 
-        self._group_parser = GroupParser.GroupParser(system_lib=self._system_lib)
+    def __init__(self, edges_to_parse = ('HasSession','AdminTo','CanVNC','CanAE'),output_path = "./output.json", state_path = None, emit_delta = False,
+                 system_lib = None, group_parser = None, properties = None, parse_workers = None, watch_interval = None):
 
         # What edges MacHound will produce
         self._local_groups = list(edges_to_parse)
 
         # Mark sessions to be collected and remove the edge from the list
+        self._do_login = False
         if "HasSession" in edges_to_parse:
             self._do_login = True
             self._local_groups.remove("HasSession")
 
+        # For daemon mode, start watching before the OpenDirectory is parsed so no change is missed in between
+        self._watcher = None
+        if watch_interval is not None:
+            self._watcher = ChangeWatcher.ChangeWatcher(GroupParser.OD_GROUPS_FOLDER,
+                                                        GroupParser.OD_USERS_FOLDER,
+                                                        session_files = [SystemLib.UTMPX_FILE] if self._do_login else [],
+                                                        interval = watch_interval)
+        
+        # Init the System library wrapping class, unless a replacement was given (e.g. for offline collection)
+        self._system_lib = system_lib if system_lib is not None else SystemLib.SystemLib()
+        
+        # initiate the local OpenDirectory Parser 
+        self._group_parser = group_parser if group_parser is not None else GroupParser.GroupParser(system_lib=self._system_lib, workers=parse_workers)
+
+        # Host properties, queried from the local machine when not given
+        self._properties = properties
+
         # Path for the output json 
         self._output = output_path
 
+        # Path for the state file holding the last emitted edge set, and whether to emit deltas against it
+        self._state_path = state_path
+        self._emit_delta = emit_delta
+
         # Output to be dumped as json
         self._json_content = dict()
 
+        # GUIDs each administrative group closure was resolved from, used to recompute only the affected groups
+        self._group_dependencies = dict()
+
 
     def start(self):
 
+        self.collect()
+
+        # Dump the queried information to the output json file
+        self._save_output()
+
+    def collect(self):
+
         # Get the local SMBSID and computer name
-        self._json_content['Properties'] = self._get_properties()
+        self._json_content['Properties'] = self._properties if self._properties is not None else self._get_properties()
 
         # Get currently logged-in Active Directory Users
         if self._do_login:
@@ -66,9 +99,91 @@ class MacHound():
         if self._local_groups:
             self._json_content['AdminGroups'] = self._get_administrative_groups()
 
-        # Dump the queried information to the output json file
-        self._save_output()
+        return self._json_content
 
+    def watch(self):
+
+        '''
+         Run as a long-running collector, MacHound must be created with a watch interval.
+         After the initial collection the OpenDirectory folders and the utmpx file are watched, and only the group
+         closures and sessions affected by a change are recomputed.
+         The output file is rewritten only when the host's edge set actually changed.
+        '''
+
+        if self._watcher is None:
+            logging.error("MacHound was not created with a watch interval")
+            raise ValueError("MacHound was not created with a watch interval")
+
+        self.start()
+
+        logging.info("Watching for changes")
+        pending_changes = None
+        while True:
+            changes = self._merge_changes(pending_changes, self._watcher.wait_for_changes())
+            if not changes:
+                continue
+
+            # A plist caught while being written, or a failed lookup, must not stop the daemon.
+            # The changes are kept and retried on the next wakeup
+            try:
+                if self._apply_changes(changes):
+                    self._save_output()
+                else:
+                    logging.debug("Changes did not affect the edge set, output was not updated")
+            except (plistlib.InvalidFileException, OSError) as e:
+                logging.error("Cannot apply changes ({0}), retrying on the next change".format(e))
+
+                # Records dropped before the failure are no longer known as dependencies, so on retry all the
+                # administrative groups (reloaded like any changed group) and the sessions are recomputed
+                pending_changes = {"groups": changes['groups'] | {ADMIN_GROUPS[bh_connetion] for bh_connetion in self._local_groups},
+                                   "users": changes['users'],
+                                   "sessions": True}
+                continue
+
+            pending_changes = None
+
+    @staticmethod
+    def _merge_changes(old_changes, new_changes):
+
+        if not old_changes or not new_changes:
+            return old_changes or new_changes
+
+        return {"groups": old_changes['groups'] | new_changes['groups'],
+                "users": old_changes['users'] | new_changes['users'],
+                "sessions": old_changes['sessions'] or new_changes['sessions']}
+
+    def _apply_changes(self, changes):
+
+        '''
+         Reload the changed OpenDirectory records and recompute the affected edges.
+         Returns True if the edge set of the host was changed.
+        '''
+
+        old_edges = MacHoundModel.get_edge_set(self._json_content)
+
+        changed_guids = set()
+        if changes['groups']:
+            changed_guids |= self._group_parser.reload_groups(changes['groups'])
+        if changes['users']:
+            changed_guids |= self._group_parser.reload_users(changes['users'])
+
+        # Sessions depend on the utmpx content and on the users being mobile users
+        if self._do_login and (changes['sessions'] or changes['users']):
+            self._json_content['Sessions'] = self._get_logged_on_session()
+
+        # Recompute only the groups whose closure went through one of the changed records
+        for bh_connetion in self._local_groups:
+            if changed_guids & self._group_dependencies.get(bh_connetion, set()) or ADMIN_GROUPS[bh_connetion] in changes['groups']:
+                logging.debug("Recomputing members of {0}".format(bh_connetion))
+                self._json_content['AdminGroups'][bh_connetion] = self._get_administrative_group(bh_connetion)
+
+        return old_edges != MacHoundModel.get_edge_set(self._json_content)
+
+    @staticmethod
+    def _get_edge_hash(edges):
+
+        # Stable hash of the edge set, used by the ingestor to check a delta applies on top of what it already has
+        return hashlib.sha256(json.dumps(sorted(edge.to_tuple() for edge in edges), separators=(',', ':')).encode()).hexdigest()
 
     def _get_properties(self):
 
@@ -112,17 +227,17 @@ class MacHound():
 
         # Iterate all sessions and search for AD users
         for username, login_time in gui_sessions_list:
-            user_plist = self._group_parser.get_user_by_name(username)
+            user_record = self._group_parser.get_user_by_name(username)
 
             # Network user - No plist file
-            if user_plist == None:
+            if user_record == None:
                 logging.warning("Network User login detected with username {0}".format(username))
                 continue
 
             # Mobile User
-            if "original_node_name" in user_plist.keys():
+            if user_record.is_mobile:
                 logging.debug("Identified possible Network user login session - {0}".format(username))
-                user_guid = user_plist['generateduid'][0]
+                user_guid = user_record.guids[0]
                 user_sid = self._system_lib.uuid_to_sid(user_guid)
                 session_list.append(user_sid)
 
@@ -135,24 +250,129 @@ class MacHound():
         output = dict()
 
         for bh_connetion in self._local_groups:
-            
-            # Get the actual group name for the edge
-            group_name = ADMIN_GROUPS[bh_connetion]
+            output[bh_connetion] = self._get_administrative_group(bh_connetion)
 
-            # Get group instance from the OpenDirectory
-            group_plist = self._group_parser.get_group_by_name(group_name)
+        return output
 
-            # Get all members of the group
-            all_members = self._group_parser.get_all_group_members(group_plist)
+    def _get_administrative_group(self, bh_connetion):
 
-            # Remove duplicates from list and add to the output
-            output[bh_connetion] = [dict(t) for t in {tuple(d.items()) for d in all_members['activedirectory_sids']}]
+        # Get the actual group name for the edge
+        group_name = ADMIN_GROUPS[bh_connetion]
 
-        return output
+        # Get group instance from the OpenDirectory
+        group_record = self._group_parser.get_group_by_name(group_name)
+        if group_record is None:
+            self._group_dependencies[bh_connetion] = set()
+            return []
+
+        # Get all members of the group
+        dependencies = set()
+        all_members = self._group_parser.get_all_group_members(group_record, dependencies)
+        self._group_dependencies[bh_connetion] = dependencies
+
+        # Members are already unique, convert them to the output format
+        return [member.to_json() for member in all_members['activedirectory_sids']]
         
     def _save_output(self):
 
-        logging.info("Writing output to file {0}".format(self._output))
-        with open(self._output,'w') as fd:
-            json.dump(self._json_content, fd)
+        output_content = self._json_content
+        output_path = self._output
+        if self._state_path:
+            state = self._load_state()
+            edges = MacHoundModel.get_edge_set(self._json_content)
+            edge_hash = self._get_edge_hash(edges)
+
+            # Nothing to send on top of the last emitted output
+            if self._emit_delta and state and edge_hash == state['Hash']:
+                logging.info("Edges did not change since output {0}, no delta was written".format(state['Sequence']))
+                return
+
+            # A new state starts a new epoch, so its sequence numbers never collide with the ones of a lost state
+            epoch = state['Epoch'] if state else self._new_epoch()
+            sequence = state['Sequence'] + 1 if state else 1
+            output_content = self._get_stateful_output(state, edges, edge_hash, epoch, sequence)
+            output_path = self._get_sequence_output_path(epoch, sequence)
+
+        # Write to a temporary file first, so an uploader or ingestor reading the output (rewritten in place by the
+        # daemon without a state file) never gets a truncated file
+        logging.info("Writing output to file {0}".format(output_path))
+        temp_path = output_path + ".tmp"
+        with open(temp_path,'w') as fd:
+            json.dump(output_content, fd)
+        os.replace(temp_path, output_path)
+
+        if self._state_path:
+            self._save_state(edges, edge_hash, epoch, sequence)
+
+    @staticmethod
+    def _new_epoch():
+
+        # Creation time of the state in milliseconds, later states get higher epochs so the ingestor can order them
+        return int(time.time() * 1000)
+
+    def _get_sequence_output_path(self, epoch, sequence):
+
+        # Every stateful output gets its own file (e.g. output.1700000000000.000042.json), so outputs not uploaded yet
+        # are never overwritten by the next run, nor by the runs following a lost state
+        output_root, output_extension = os.path.splitext(self._output)
+        return "{0}.{1}.{2:06d}{3}".format(output_root, epoch, sequence, output_extension or ".json")
+
+    def _get_stateful_output(self, state, edges, edge_hash, epoch, sequence):
+
+        '''
+         Build the output against the last emitted edge set stored in the state file.
+         A full snapshot is tagged with the state epoch, its sequence number and edge hash. A delta document lists only
+         the edges added and removed since the last run, and the hash of the edge set it applies on (BaseHash).
+        '''
+
+        if not self._emit_delta or not state:
+            output = dict(self._json_content)
+            output['Epoch'] = epoch
+            output['Sequence'] = sequence
+            output['Hash'] = edge_hash
+            return output
+
+        base_edges = MacHoundModel.get_edge_set(state)
+        logging.info("Emitting delta {0} on top of {1}".format(sequence, state['Hash']))
+
+        return {"Properties": self._json_content['Properties'],
+                "Delta": {"Epoch": epoch,
+                          "Sequence": sequence,
+                          "BaseHash": state['Hash'],
+                          "Hash": edge_hash,
+                          "Added": MacHoundModel.get_edge_content(edges - base_edges),
+                          "Removed": MacHoundModel.get_edge_content(base_edges - edges)}}
+
+    def _load_state(self):
+
+        if not os.path.exists(self._state_path):
+            logging.info("State file {0} was not found, a full snapshot will be emitted".format(self._state_path))
+            return None
+
+        try:
+            with open(self._state_path,'r') as fd:
+                state = json.load(fd)
+        except (OSError, ValueError) as e:
+            logging.warning("Cannot read state file {0} ({1}), a full snapshot will be emitted".format(self._state_path, e))
+            return None
+
+        # States written before epochs were introduced cannot be continued
+        if not isinstance(state, dict) or not {'Epoch', 'Sequence', 'Hash'} <= state.keys():
+            logging.warning("State file {0} is incomplete, a full snapshot will be emitted".format(self._state_path))
+            return None
+        return state
+
+    def _save_state(self, edges, edge_hash, epoch, sequence):
+
+        # The state holds the full emitted edge set, so the next run can diff against it
+        state = MacHoundModel.get_edge_content(edges)
+        state['Epoch'] = epoch
+        state['Sequence'] = sequence
+        state['Hash'] = edge_hash
+
+        # Write to a temporary file first so an interrupted run never leaves a truncated state behind
+        temp_path = self._state_path + ".tmp"
+        with open(temp_path,'w') as fd:
+            json.dump(state, fd)
+        os.replace(temp_path, self._state_path)
 
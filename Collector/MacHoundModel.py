@@ -0,0 +1,162 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import sys
+import enum
+
+# Compact in-memory model shared by the collector and the ingestor.
+# Records keep only the fields MacHound uses out of the OpenDirectory plists. GUIDs, SIDs and names are interned
+# so the same identifier is stored once no matter how many groups reference it.
+# The collector and the ingestor are deployed separately, so this file is copied to Collector/ and Ingestor/.
+# Edit both copies together, tests/test_model_sync.py checks they are identical.
+
+class MemberType(enum.Enum):
+    USER = "User"
+    GROUP = "Group"
+
+class EdgeType(enum.Enum):
+    HAS_SESSION = "HasSession"
+    ADMIN_TO = "AdminTo"
+    CAN_SSH = "CanSSH"
+    CAN_VNC = "CanVNC"
+    CAN_AE = "CanAE"
+
+def _intern_all(values):
+    return tuple(sys.intern(value) for value in values)
+
+class UserRecord(object):
+
+    __slots__ = ("name", "guids", "original_node_name")
+
+    def __init__(self, name, guids, original_node_name = None):
+        self.name = sys.intern(name)
+        self.guids = _intern_all(guids)
+        self.original_node_name = original_node_name
+
+    @classmethod
+    def from_plist(cls, record_name, user_plist):
+
+        # Mobile users are identified by the original_node_name property
+        original_node_name = user_plist['original_node_name'][0] if user_plist.get('original_node_name') else None
+        return cls(user_plist.get('name', [record_name])[0], user_plist.get('generateduid', []), original_node_name)
+
+    @property
+    def is_mobile(self):
+        return self.original_node_name is not None
+
+    def __reduce__(self):
+        # Rebuild through __init__ when unpickled (e.g. from a worker process) so the strings are interned again
+        return (self.__class__, (self.name, self.guids, self.original_node_name))
+
+class GroupRecord(object):
+
+    __slots__ = ("name", "guids", "members", "nested_groups")
+
+    def __init__(self, name, guids, members = (), nested_groups = ()):
+        self.name = sys.intern(name)
+        self.guids = _intern_all(guids)
+        self.members = _intern_all(members)
+        self.nested_groups = _intern_all(nested_groups)
+
+    @classmethod
+    def from_plist(cls, record_name, group_plist):
+
+        # Direct members are stored under 'groupmembers', nested groups under 'nestedgroups'
+        return cls(group_plist.get('name', [record_name])[0],
+                   group_plist.get('generateduid', []),
+                   group_plist.get('groupmembers', []),
+                   group_plist.get('nestedgroups', []))
+
+    def __reduce__(self):
+        # Rebuild through __init__ when unpickled (e.g. from a worker process) so the strings are interned again
+        return (self.__class__, (self.name, self.guids, self.members, self.nested_groups))
+
+class Member(object):
+
+    __slots__ = ("member_id", "member_type")
+
+    def __init__(self, member_id, member_type):
+        self.member_id = sys.intern(member_id)
+        self.member_type = MemberType(member_type)
+
+    @classmethod
+    def from_json(cls, member_content):
+        return cls(member_content['MemberId'], member_content['MemberType'])
+
+    def to_json(self):
+        return {"MemberId": self.member_id, "MemberType": self.member_type.value}
+
+    def __eq__(self, other):
+        return isinstance(other, Member) and self.member_id == other.member_id and self.member_type is other.member_type
+
+    def __hash__(self):
+        return hash((self.member_id, self.member_type))
+
+    def __repr__(self):
+        return "Member({0}, {1})".format(self.member_id, self.member_type.value)
+
+class Edge(object):
+
+    __slots__ = ("edge_type", "member")
+
+    def __init__(self, edge_type, member):
+        self.edge_type = EdgeType(edge_type)
+        self.member = member
+
+    def to_tuple(self):
+        return (self.edge_type.value, self.member.member_id, self.member.member_type.value)
+
+    def __eq__(self, other):
+        return isinstance(other, Edge) and self.edge_type is other.edge_type and self.member == other.member
+
+    def __lt__(self, other):
+        return self.to_tuple() < other.to_tuple()
+
+    def __hash__(self):
+        return hash((self.edge_type, self.member))
+
+    def __repr__(self):
+        return "Edge({0}, {1}, {2})".format(*self.to_tuple())
+
+def get_edge_set(json_content):
+
+    '''
+     Order independent representation of the edges of a collector output (or of a delta Added/Removed part).
+    '''
+
+    edges = set()
+    for user_sid in json_content.get('Sessions', []):
+        edges.add(Edge(EdgeType.HAS_SESSION, Member(user_sid, MemberType.USER)))
+    for edge_type, members in json_content.get('AdminGroups', dict()).items():
+        for member_content in members:
+            edges.add(Edge(edge_type, Member.from_json(member_content)))
+    return edges
+
+def get_edge_content(edges):
+
+    '''
+     Convert an edge set back to the Sessions and AdminGroups format of the collector output.
+    '''
+
+    content = {"Sessions": [], "AdminGroups": dict()}
+    for edge in sorted(edges):
+        if EdgeType.HAS_SESSION is edge.edge_type:
+            content["Sessions"].append(edge.member.member_id)
+        else:
+            content["AdminGroups"].setdefault(edge.edge_type.value, []).append(edge.member.to_json())
+    return content
@@ -0,0 +1,282 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import csv
+import json
+import logging
+import tarfile
+import plistlib
+import concurrent.futures
+import GroupParser
+import MacHound
+
+# Where the Default OpenDirectory node can be found in an extracted tree, depending on where the tree was taken from
+DSLOCAL_NODE_PATHS = ("var/db/dslocal/nodes/Default",
+                      "private/var/db/dslocal/nodes/Default",
+                      "dslocal/nodes/Default",
+                      "nodes/Default",
+                      "Default",
+                      "")
+
+ARCHIVE_EXTENSIONS = (".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".tbz2", ".txz", ".tar")
+
+# GUID -> SID mapping shared by the worker processes, set by the pool initializer
+_worker_mapping = None
+
+def normalize_guid(guid):
+
+    # OpenDirectory stores GUIDs upper case without braces, Active Directory exports vary
+    return guid.strip().strip("{}").upper()
+
+class MappingSystemLib(object):
+
+    def __init__(self, guid_to_sid):
+
+        '''
+         Replacement of SystemLib for offline collection, where the membership API of the collected host is not
+         available. GUIDs are translated to SIDs using a mapping loaded from an Active Directory export.
+        '''
+
+        self._guid_to_sid = guid_to_sid
+
+    def uuid_to_sid(self, uuid):
+
+        sid = self._guid_to_sid.get(normalize_guid(uuid))
+        if sid is None:
+            logging.warning("GUID {0} was not found in the mapping and was ignored".format(uuid))
+        return sid
+
+class ArchiveGroupParser(GroupParser.GroupParser):
+
+    def __init__(self, archive_path, system_lib):
+
+        '''
+         Parse the OpenDirectory scheme straight out of a tar archive, without extracting it to disk.
+         The archive is read in a single streaming pass, keeping only the content of the users and groups plists.
+        '''
+
+        self._archive_path = archive_path
+        self._archive_files = dict()
+
+        node_prefix = self._read_archive(archive_path)
+        super(ArchiveGroupParser, self).__init__(system_lib = system_lib,
+                                                 groups_dir = node_prefix + "groups",
+                                                 users_dir = node_prefix + "users")
+
+        # The raw content is not needed once parsed
+        self._archive_files = dict()
+
+    def _read_archive(self, archive_path):
+
+        '''
+         Read all groups/users plists found in the archive and return the node prefix they are stored under.
+         If several nodes are found the Default dslocal node is preferred.
+        '''
+
+        plist_files = dict()
+        with tarfile.open(archive_path, "r|*") as tar:
+            for member in tar:
+                if not member.isfile() or not member.name.endswith(".plist"):
+                    continue
+
+                member_path = member.name[2:] if member.name.startswith("./") else member.name
+                folder_path, file_name = os.path.split(member_path)
+                if os.path.basename(folder_path) not in ("groups", "users"):
+                    continue
+
+                plist_files[member_path] = tar.extractfile(member).read()
+
+        node_prefixes = {os.path.dirname(os.path.dirname(member_path)) for member_path in plist_files}
+        if not node_prefixes:
+            logging.error("No OpenDirectory scheme was found in archive {0}".format(archive_path))
+            raise ValueError("No OpenDirectory scheme was found in archive {0}".format(archive_path))
+
+        node_prefix = sorted(node_prefixes, key = lambda prefix: (not prefix.endswith("dslocal/nodes/Default"), prefix))[0]
+        node_prefix = node_prefix + "/" if node_prefix else ""
+
+        self._archive_files = {member_path: content for member_path, content in plist_files.items() if member_path.startswith(node_prefix)}
+        return node_prefix
+
+    def _list_plist_files(self, folder_path):
+
+        return [os.path.basename(member_path) for member_path in self._archive_files if os.path.dirname(member_path) == folder_path]
+
+    def _parse_plist_file(self, plist_path):
+
+        if not plist_path in self._archive_files:
+            logging.error("Plist file {0} was not found in archive {1}".format(plist_path, self._archive_path))
+            return None
+
+        return plistlib.loads(self._archive_files[plist_path])
+
+def load_mapping(mapping_paths):
+
+    '''
+     Load the GUID -> SID mapping and the computer name -> SID mapping from the given files.
+     Supported formats are:
+      - CSV files with guid,sid[,name] columns
+      - JSON objects of {guid : sid}
+      - BloodHound JSON exports, where each entry has an ObjectIdentifier and objectguid/name properties
+    '''
+
+    guid_to_sid = dict()
+    name_to_sid = dict()
+
+    for mapping_path in mapping_paths:
+        logging.info("Loading GUID mapping from {0}".format(mapping_path))
+
+        if mapping_path.lower().endswith(".csv"):
+            with open(mapping_path, 'r', newline='') as fp:
+                for row in csv.DictReader(fp):
+                    row = {key.strip().lower(): value for key, value in row.items() if key}
+                    if row.get('guid') and row.get('sid'):
+                        guid_to_sid[normalize_guid(row['guid'])] = row['sid'].strip()
+                    if row.get('name') and row.get('sid'):
+                        name_to_sid[row['name'].strip().upper()] = row['sid'].strip()
+            continue
+
+        with open(mapping_path, 'r') as fp:
+            json_content = json.load(fp)
+
+        entries = []
+        for value in json_content.values():
+            if isinstance(value, list):
+                entries += [entry for entry in value if isinstance(entry, dict)]
+
+        # Plain {guid : sid} mapping
+        if not entries:
+            guid_to_sid.update({normalize_guid(guid): sid for guid, sid in json_content.items() if isinstance(sid, str)})
+            continue
+
+        for entry in entries:
+            properties = entry.get('Properties', dict())
+            sid = entry.get('ObjectIdentifier') or properties.get('objectid')
+            if not sid:
+                continue
+            if properties.get('objectguid'):
+                guid_to_sid[normalize_guid(properties['objectguid'])] = sid
+            if properties.get('name'):
+                name_to_sid[properties['name'].upper()] = sid
+
+    logging.info("Loaded {0} GUIDs and {1} names".format(len(guid_to_sid), len(name_to_sid)))
+    return guid_to_sid, name_to_sid
+
+def get_host_name(source_path):
+
+    # The host is identified by the archive or folder name, e.g. host.domain.local.tar.gz
+    host_name = os.path.basename(os.path.normpath(source_path))
+    for extension in ARCHIVE_EXTENSIONS:
+        if host_name.lower().endswith(extension):
+            return host_name[:-len(extension)]
+    return host_name
+
+def get_host_properties(host_name, name_to_sid):
+
+    '''
+     Get the SMBSID and the Active Directory name of the host from the mapping.
+     Hosts missing from the mapping cannot be ingested, so they fail the collection of the host.
+    '''
+
+    host_name = host_name.upper()
+    if host_name in name_to_sid:
+        return {"objectid": name_to_sid[host_name], "name": host_name}
+
+    # Archives are often named after the short host name, BloodHound stores the FQDN
+    candidates = [name for name in name_to_sid if name.startswith(host_name + ".")]
+    if 1 == len(candidates):
+        return {"objectid": name_to_sid[candidates[0]], "name": candidates[0]}
+
+    logging.error("Computer {0} was not found in the mapping".format(host_name))
+    raise ValueError("Computer {0} was not found in the mapping".format(host_name))
+
+def find_node_folder(tree_path):
+
+    '''
+     Find the Default OpenDirectory node in an extracted tree, the folder holding the groups and users folders.
+    '''
+
+    for node_path in DSLOCAL_NODE_PATHS:
+        candidate = os.path.join(tree_path, node_path)
+        if os.path.isdir(os.path.join(candidate, "groups")) and os.path.isdir(os.path.join(candidate, "users")):
+            return candidate
+
+    for root, dirs, files in os.walk(tree_path):
+        if "groups" in dirs and "users" in dirs:
+            return root
+
+    logging.error("No OpenDirectory scheme was found in {0}".format(tree_path))
+    raise ValueError("No OpenDirectory scheme was found in {0}".format(tree_path))
+
+def _init_worker(mapping):
+
+    global _worker_mapping
+    _worker_mapping = mapping
+
+def _collect_host(source_path, edges_to_parse):
+
+    guid_to_sid, name_to_sid = _worker_mapping
+    system_lib = MappingSystemLib(guid_to_sid)
+    host_properties = get_host_properties(get_host_name(source_path), name_to_sid)
+
+    if os.path.isdir(source_path):
+        node_folder = find_node_folder(source_path)
+        group_parser = GroupParser.GroupParser(system_lib = system_lib,
+                                               groups_dir = os.path.join(node_folder, "groups"),
+                                               users_dir = os.path.join(node_folder, "users"))
+    else:
+        group_parser = ArchiveGroupParser(source_path, system_lib)
+
+    machound = MacHound.MacHound(edges_to_parse = edges_to_parse,
+                                 system_lib = system_lib,
+                                 group_parser = group_parser,
+                                 properties = host_properties)
+    return machound.collect()
+
+def run_batch(source_paths, mapping_paths, output_path, edges_to_parse, workers = None):
+
+    '''
+     Collect many hosts from dslocal archives or extracted trees across a process pool.
+     The output is written as NDJSON, one record per host, in the order the hosts complete.
+    '''
+
+    # Sessions are read from the live utmpx database and cannot be collected offline
+    edges_to_parse = [edge for edge in edges_to_parse if edge != "HasSession"]
+
+    mapping = load_mapping(mapping_paths)
+    failed_paths = []
+
+    with open(output_path, 'w') as fd, \
+         concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = _init_worker, initargs = (mapping,)) as executor:
+
+        futures = {executor.submit(_collect_host, source_path, edges_to_parse): source_path for source_path in source_paths}
+        for future in concurrent.futures.as_completed(futures):
+            source_path = futures[future]
+            try:
+                json_content = future.result()
+            except Exception as e:
+                logging.error("Collection of {0} failed - {1}".format(source_path, e))
+                failed_paths.append(source_path)
+                continue
+
+            logging.info("Collected {0}".format(source_path))
+            fd.write(json.dumps(json_content) + "\n")
+
+    logging.info("Batch collection completed, {0} hosts collected, {1} failed".format(len(source_paths) - len(failed_paths), len(failed_paths)))
+    if failed_paths:
+        logging.error("Failed hosts: {0}".format(", ".join(sorted(failed_paths))))
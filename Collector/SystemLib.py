@@ -30,6 +30,9 @@ ID_TYPE_UID = 0
 ID_TYPE_GID = 1
 NTSID_MAX_AUTHORITIES = 16
 
+# The utmpx database file, updated by the system on every login and logout
+UTMPX_FILE = r"/var/run/utmpx"
+
 # Structs used for utmpx access
 
 class timeval(ctypes.Structure):
@@ -17,8 +17,12 @@
 '''
 
 import MacHound
+import MacHoundModel
+import ChangeWatcher
+import OfflineCollector
 import logging
 import argparse
+import multiprocessing
 import os
 
 LICENSE_TEXT = "MacHound  Copyright (C) 2021  XMCyber\n"+\
@@ -26,7 +30,7 @@ LICENSE_TEXT = "MacHound  Copyright (C) 2021  XMCyber\n"+\
                "This is free software, and you are welcome to redistribute it\n"+\
                "under certain conditions; see attached license for details.\n\n"
 
-ACCEPTED_COLLECTORS = ('HasSession','AdminTo','CanSSH','CanVNC','CanAE')
+ACCEPTED_COLLECTORS = tuple(edge_type.value for edge_type in MacHoundModel.EdgeType)
 
 def validate_collector_methods(methods):
 
@@ -70,6 +74,49 @@ def main():
                            default=None,
                            help='Path to log file.')
 
+    argparser.add_argument('-s',
+                           '--statefile',
+                           action='store',
+                           default=None,
+                           help='Path to a state file keeping the last emitted edges, each output is tagged with a sequence number and hash and written to its own <outputfile>.<sequence>.json')
+
+    argparser.add_argument('--delta',
+                           action='store_true',
+                           help='Emit only the edges added and removed since the last run (requires --statefile)')
+
+    argparser.add_argument('-b',
+                           '--batch',
+                           action='store',
+                           nargs='+',
+                           default=None,
+                           help='Collect offline from dslocal tar archives or extracted trees (named after the hosts) instead of the local machine, output is NDJSON')
+
+    argparser.add_argument('-m',
+                           '--mapping',
+                           action='append',
+                           default=[],
+                           help='GUID to SID mapping for batch mode: CSV (guid,sid[,name]), JSON {guid: sid} or BloodHound JSON export. Can be repeated')
+
+    argparser.add_argument('-w',
+                           '--workers',
+                           action='store',
+                           type=int,
+                           default=None,
+                           help='Number of worker processes. In batch mode hosts are collected in parallel (default is the number of CPUs), '
+                                'otherwise large OpenDirectory folders are decoded in parallel (experimental, default is serial decoding)')
+
+    argparser.add_argument('-d',
+                           '--daemon',
+                           action='store_true',
+                           help='Keep running and update the output file only when the collected edges change')
+
+    argparser.add_argument('-i',
+                           '--interval',
+                           action='store',
+                           type=int,
+                           default=ChangeWatcher.DEFAULT_POLL_INTERVAL,
+                           help="Maximal interval in seconds between change checks in daemon mode (default is {0})".format(ChangeWatcher.DEFAULT_POLL_INTERVAL))
+
     args = argparser.parse_args()
 
    
@@ -92,10 +139,31 @@ def main():
     # Get the output json path
     output_path = args.outputfile
 
+    # Offline collection of many hosts
+    if args.batch:
+        if not args.mapping:
+            logging.error("Batch mode requires a GUID to SID mapping")
+            raise ValueError("Batch mode requires a GUID to SID mapping")
+        if args.daemon or args.statefile or args.delta:
+            logging.error("Batch mode cannot be combined with daemon mode, a state file or delta output")
+            raise ValueError("Batch mode cannot be combined with daemon mode, a state file or delta output")
+        OfflineCollector.run_batch(args.batch, args.mapping, output_path, methods, args.workers)
+        return
+
+    if args.delta and not args.statefile:
+        logging.error("Delta output requires a state file")
+        raise ValueError("Delta output requires a state file")
+
     # Start collection
-    machound = MacHound.MacHound(edges_to_parse=methods, output_path=output_path)
-    machound.start()
+    machound = MacHound.MacHound(edges_to_parse=methods, output_path=output_path, state_path=args.statefile, emit_delta=args.delta,
+                                 parse_workers=args.workers, watch_interval=args.interval if args.daemon else None)
+    if args.daemon:
+        machound.watch()
+    else:
+        machound.start()
 
 
 if "__main__" == __name__:
+    # Worker processes of frozen (py2app) builds re-execute this script, both process pools rely on it
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -16,11 +16,18 @@
 
 '''
 
-import neo4j
 import os
 import logging
 import json
+import csv
 import argparse
+import MacHoundModel
+
+# Only the bulk CSV export can run without the neo4j driver
+try:
+    import neo4j
+except ImportError:
+    neo4j = None
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -29,19 +36,61 @@ CREATE_RELATIONSHIP         = "MATCH (a:Computer {{ objectid: $computer_sid }}),
 CREATE_SESSION              = "MATCH (a:Computer { objectid: $computer_sid }),(b:User { objectid: $ad_member_sid }) MERGE (a)-[r:HasSession]->(b) RETURN a.name, type(r), b.name"
 GET_MACHINE_QUERY           = "MATCH (host:Computer) WHERE host.objectid = $smb_sid RETURN host.name"
 GET_DOMAIN_OBJECT_QUERY     = "MATCH (domainobject:{ad_member_type}) WHERE domainobject.objectid = $smb_sid RETURN domainobject.name"
+GET_MACHINE_HASH_QUERY      = "MATCH (host:Computer { objectid: $computer_sid }) RETURN host.machoundhash AS hash, host.machoundepoch AS epoch, host.machoundsequence AS sequence"
+MARK_MACHOUND_COMPUTER      = "MATCH (host:Computer { objectid: $computer_sid }) SET host.machound = true"
+SET_MACHINE_HASH_QUERY      = "MATCH (host:Computer { objectid: $computer_sid }) SET host.machoundhash = $edge_hash, host.machoundepoch = $epoch, host.machoundsequence = $sequence"
+MERGE_SESSIONS_BATCH        = "MATCH (a:Computer { objectid: $computer_sid }) UNWIND $member_sids AS member_sid MATCH (b:User { objectid: member_sid }) MERGE (a)-[r:HasSession]->(b)"
+DELETE_SESSIONS_BATCH       = "MATCH (a:Computer { objectid: $computer_sid })-[r:HasSession]->(b:User) WHERE b.objectid IN $member_sids DELETE r"
+MERGE_RELATIONSHIPS_BATCH   = "MATCH (a:Computer {{ objectid: $computer_sid }}) UNWIND $member_sids AS member_sid MATCH (b:{ad_member_type} {{ objectid: member_sid }}) MERGE (b)-[r:{connection_type}]->(a)"
+DELETE_RELATIONSHIPS_BATCH  = "MATCH (a:Computer {{ objectid: $computer_sid }})<-[r:{connection_type}]-(b:{ad_member_type}) WHERE b.objectid IN $member_sids DELETE r"
+DELETE_STALE_SESSIONS       = "MATCH (a:Computer { objectid: $computer_sid })-[r:HasSession]->(b:User) WHERE NOT b.objectid IN $member_sids DELETE r"
+DELETE_STALE_RELATIONSHIPS  = "MATCH (a:Computer {{ objectid: $computer_sid }})<-[r:{connection_type}]-(b:{ad_member_type}) WHERE NOT b.objectid IN $member_sids DELETE r"
+
+# Bulk export of relationships only, loaded with LOAD CSV WITH HEADERS into a database already holding the AD nodes
+CSV_HEADER                  = ["start_sid", "end_sid", "edge_type", "member_type"]
+CSV_ROWS_PER_TX             = 1000
+CSV_LOAD_SCRIPT_NAME        = "load_machound.cypher"
+LOAD_CSV_SESSIONS           = "LOAD CSV WITH HEADERS FROM '{csv_url}' AS row\nCALL {{\n  WITH row\n  MATCH (a:Computer {{ objectid: row.start_sid }}),(b:User {{ objectid: row.end_sid }})\n  MERGE (a)-[r:HasSession]->(b)\n  SET a.machound = true\n}} IN TRANSACTIONS OF {rows_per_tx} ROWS;\n"
+LOAD_CSV_RELATIONSHIPS      = "LOAD CSV WITH HEADERS FROM '{csv_url}' AS row\nWITH row WHERE row.member_type = '{ad_member_type}'\nCALL {{\n  WITH row\n  MATCH (a:Computer {{ objectid: row.end_sid }}),(b:{ad_member_type} {{ objectid: row.start_sid }})\n  MERGE (b)-[r:{connection_type}]->(a)\n  SET a.machound = true\n}} IN TRANSACTIONS OF {rows_per_tx} ROWS;\n"
+
+# Post-ingest precomputation of the effective (transitive through MemberOf) access of users to the Macs
+EFFECTIVE_EDGES             = {"AdminTo":"EffectiveAdminTo",
+                               "CanSSH":"EffectiveCanSSH",
+                               "CanVNC":"EffectiveCanVNC",
+                               "CanAE":"EffectiveCanAE"}
+PRECOMPUTE_BATCH_SIZE       = 50
+PRECOMPUTE_ROWS_PER_TX      = 10000
+GET_MACHOUND_COMPUTERS_PAGE = "MATCH (c:Computer) WHERE c.objectid > $last_sid AND (c.machound = true OR EXISTS {{ MATCH (c)<-[:{effective_types}]-(:User) }}) RETURN c.objectid AS computer_sid ORDER BY computer_sid LIMIT $limit"
+DELETE_EFFECTIVE_EDGES      = "MATCH (c:Computer)<-[r:{effective_type}]-(:User) WHERE c.objectid IN $computer_sids CALL {{ WITH r DELETE r }} IN TRANSACTIONS OF {rows_per_tx} ROWS"
+CREATE_EFFECTIVE_EDGES      = "MATCH (c:Computer)<-[:{connection_type}]-(m) WHERE c.objectid IN $computer_sids AND (m:User OR m:Group) MATCH (u:User)-[:MemberOf*0..]->(m) WITH DISTINCT u, c CALL {{ WITH u, c MERGE (u)-[r:{effective_type}]->(c) SET r.machound = true }} IN TRANSACTIONS OF {rows_per_tx} ROWS"
 
 class MachoundIngestor(object):
 
     def __init__(self,address = "neo4j://localhost:7687", auth = ('username','password')):
+        if neo4j is None:
+            logging.error("The neo4j driver is not installed, see requirements.txt")
+            raise ImportError("The neo4j driver is not installed, see requirements.txt")
+
         self.driver = neo4j.GraphDatabase.driver(address, auth=auth)
 
+        # Hosts whose delta did not match the ingested edges and must send a full snapshot
+        self.resync_hosts = []
+
+        # Computers whose AdminTo/CanSSH/CanVNC/CanAE edges were changed during this run
+        self.changed_computers = set()
+
     def close_session(self):
         self.driver.close()
 
+    @staticmethod
+    def _count_changes(result):
+        counters = result.consume().counters
+        return counters.relationships_created + counters.relationships_deleted
+
     @staticmethod
     def add_user_connection(tx, computer_sid, ad_member_sid, ad_member_type, connection_type):
         query = CREATE_RELATIONSHIP.format(**{"ad_member_type":ad_member_type,"connection_type":connection_type})
-        tx.run(query, computer_sid=computer_sid, ad_member_sid=ad_member_sid)
+        return MachoundIngestor._count_changes(tx.run(query, computer_sid=computer_sid, ad_member_sid=ad_member_sid))
 
     @staticmethod
     def get_computer_instance(tx, smb_sid):
@@ -61,56 +110,431 @@ class MachoundIngestor(object):
         return output
 
 
+    @staticmethod
+    def get_computer_version(tx, computer_sid):
+        record = tx.run(GET_MACHINE_HASH_QUERY, computer_sid=computer_sid).single()
+        if record is None or record["sequence"] is None:
+            return None
+        return (record["epoch"] or 0, record["sequence"])
+
     @staticmethod
     def add_user_session(tx, computer_sid, ad_member_sid):
         tx.run(CREATE_SESSION, computer_sid=computer_sid, ad_member_sid=ad_member_sid)
 
-    def parse_json(self, json_content):
-        logging.debug("Starting neo4j session")
-        db_session = self.driver.session()
+    @staticmethod
+    def replace_snapshot_edges(tx, computer_sid, json_content, edges):
+
+        '''
+         Delete the edges of the computer that are not part of the snapshot, then store the snapshot hash,
+         so the graph matches the hash following deltas are based on.
+         Only the edge types collected in the snapshot are touched. Returns the number of deleted relationships,
+         not counting sessions.
+        '''
+
+        collected_types = [MacHoundModel.EdgeType(edge_type) for edge_type in json_content.get('AdminGroups', dict())]
+        if 'Sessions' in json_content:
+            collected_types.append(MacHoundModel.EdgeType.HAS_SESSION)
+
+        changes = 0
+        for edge_type in collected_types:
+            if MacHoundModel.EdgeType.HAS_SESSION is edge_type:
+                member_sids = [edge.member.member_id for edge in edges if edge.edge_type is edge_type]
+                tx.run(DELETE_STALE_SESSIONS, computer_sid=computer_sid, member_sids=member_sids)
+                continue
 
-        logging.info("Now parsing json for hostname {name} with smb sid {objectid}".format(**json_content['Properties']))
-        host_name = json_content['Properties']['name']
-        host_smbsid = json_content['Properties']['objectid']
-        if [] == db_session.read_transaction(self.get_computer_instance,host_smbsid):
-            logging.error("SMB Sid {0} was not found in the neo4j database".format(host_smbsid))
+            for member_type in MacHoundModel.MemberType:
+                member_sids = [edge.member.member_id for edge in edges if edge.edge_type is edge_type and edge.member.member_type is member_type]
+                query = DELETE_STALE_RELATIONSHIPS.format(**{"ad_member_type":member_type.value,"connection_type":edge_type.value})
+                changes += MachoundIngestor._count_changes(tx.run(query, computer_sid=computer_sid, member_sids=member_sids))
+
+        tx.run(SET_MACHINE_HASH_QUERY, computer_sid=computer_sid, edge_hash=json_content['Hash'], epoch=json_content.get('Epoch'), sequence=json_content['Sequence'])
+        return changes
+
+    @staticmethod
+    def apply_delta(tx, computer_sid, delta):
+
+        '''
+         Apply the added and removed edges of a delta document as batched MERGE/DELETE operations.
+         The delta is applied only if its BaseHash matches the edge hash stored on the Computer, otherwise None is returned.
+         Returns the number of changed relationships, not counting sessions.
+        '''
+
+        record = tx.run(GET_MACHINE_HASH_QUERY, computer_sid=computer_sid).single()
+        if record is None or record["hash"] != delta['BaseHash']:
             return None
 
-        # Parse Sessions
-        for user_smbsid in json_content['Sessions']:
-            if [] == db_session.read_transaction(self.get_adobject_instance,user_smbsid, "User"):
-                logging.error("User with SMB Sid {0} was not found in the neo4j database".format(user_smbsid))
-                continue
-            db_session.write_transaction(self.add_user_session, host_smbsid, user_smbsid)
+        changes = 0
+
+        for edges_content, session_query, relationship_query in ((delta['Removed'], DELETE_SESSIONS_BATCH, DELETE_RELATIONSHIPS_BATCH),
+                                                                 (delta['Added'], MERGE_SESSIONS_BATCH, MERGE_RELATIONSHIPS_BATCH)):
 
-        # Parse Admin groups
-        for admin_type in json_content['admin_groups']:
-            for object_content in json_content['admin_groups'][admin_type]:
-                object_type = object_content['MemberType']
-                object_sid = object_content['MemberId']
+            # Parsing the edges validates the edge and member types, as they are formatted into the queries.
+            # Labels cannot be parameters, so members are batched per edge and member type
+            batches = dict()
+            for edge in MacHoundModel.get_edge_set(edges_content):
+                batches.setdefault((edge.edge_type, edge.member.member_type), []).append(edge.member.member_id)
+
+            for (edge_type, member_type), member_sids in batches.items():
+                if MacHoundModel.EdgeType.HAS_SESSION is edge_type:
+                    tx.run(session_query, computer_sid=computer_sid, member_sids=member_sids)
+                else:
+                    query = relationship_query.format(**{"ad_member_type":member_type.value,"connection_type":edge_type.value})
+                    changes += MachoundIngestor._count_changes(tx.run(query, computer_sid=computer_sid, member_sids=member_sids))
+
+        tx.run(SET_MACHINE_HASH_QUERY, computer_sid=computer_sid, edge_hash=delta['Hash'], epoch=delta.get('Epoch'), sequence=delta['Sequence'])
+        return changes
+
+    @staticmethod
+    def mark_machound_computer(tx, computer_sid):
+        tx.run(MARK_MACHOUND_COMPUTER, computer_sid=computer_sid)
+
+    @staticmethod
+    def get_machound_computers_page(tx, last_sid, limit):
+
+        # Macs ingested by MacHound, and computers left with effective edges (e.g. whose Mac edges were all removed)
+        query = GET_MACHOUND_COMPUTERS_PAGE.format(**{"effective_types":"|".join(EFFECTIVE_EDGES.values())})
+        return [record["computer_sid"] for record in tx.run(query, last_sid=last_sid, limit=limit)]
+
+    @staticmethod
+    def refresh_effective_edges(db_session, computer_sids, rows_per_tx):
+
+        '''
+         Replace the effective access edges of a batch of computers.
+         Users get an Effective<edge> to the computer if they hold the edge directly or through any MemberOf chain.
+         Nested groups can expand to millions of (user, computer) pairs, so the edges are deleted and merged in
+         transactions of rows_per_tx rows. CALL IN TRANSACTIONS only runs in auto-commit transactions (Neo4j 4.4+),
+         hence the queries are run on the session and not in a transaction function.
+        '''
+
+        for connection_type, effective_type in EFFECTIVE_EDGES.items():
+            db_session.run(DELETE_EFFECTIVE_EDGES.format(**{"effective_type":effective_type,"rows_per_tx":int(rows_per_tx)}), computer_sids=computer_sids).consume()
+            db_session.run(CREATE_EFFECTIVE_EDGES.format(**{"connection_type":connection_type,"effective_type":effective_type,"rows_per_tx":int(rows_per_tx)}),
+                           computer_sids=computer_sids).consume()
+
+    def precompute_effective_access(self, only_changed = True, batch_size = PRECOMPUTE_BATCH_SIZE, rows_per_tx = PRECOMPUTE_ROWS_PER_TX):
+
+        '''
+         Post-ingest stage precomputing the transitive access of users to the Macs, so path queries do not have to
+         re-expand nested group membership. Computers are refreshed batch_size at a time, writing rows_per_tx edges per
+         transaction.
+         By default only the computers whose MacHound edges changed in this run are refreshed, otherwise all the Macs
+         ingested by MacHound and the computers still holding effective edges are paged through by SMB Sid.
+         A full refresh is needed after group memberships change.
+        '''
+
+        with self.driver.session() as db_session:
+
+            if only_changed:
+                computer_sids = sorted(self.changed_computers)
+                logging.info("Refreshing effective access of {0} changed computers".format(len(computer_sids)))
+                for i in range(0, len(computer_sids), batch_size):
+                    self.refresh_effective_edges(db_session, computer_sids[i:i + batch_size], rows_per_tx)
+                return
+
+            logging.info("Refreshing effective access of all computers")
+            last_sid = ""
+            refreshed = 0
+            while True:
+                computer_sids = db_session.read_transaction(self.get_machound_computers_page, last_sid, batch_size)
+                if not computer_sids:
+                    break
+                self.refresh_effective_edges(db_session, computer_sids, rows_per_tx)
+                refreshed += len(computer_sids)
+                last_sid = computer_sids[-1]
+            logging.info("Refreshed effective access of {0} computers".format(refreshed))
+
+    def parse_json(self, json_content):
+        logging.debug("Starting neo4j session")
+        with self.driver.session() as db_session:
+
+            if not json_content.get('Properties', dict()).get('objectid'):
+                logging.error("Output without an SMB Sid was ignored")
+                return None
+
+            host_name = json_content['Properties'].get('name')
+            host_smbsid = json_content['Properties']['objectid']
+            logging.info("Now parsing json for hostname {0} with smb sid {1}".format(host_name, host_smbsid))
+
+            # Parse the edges before any write, so a malformed output skips the host instead of aborting the run
+            try:
+                if 'Delta' in json_content:
+                    for edges_content in (json_content['Delta']['Added'], json_content['Delta']['Removed']):
+                        MacHoundModel.get_edge_set(edges_content)
+                else:
+                    edges = get_snapshot_edges(json_content)
+            except (ValueError, KeyError, TypeError) as e:
+                logging.error("Output of {0} is malformed and was ignored - {1!r}".format(host_name, e))
+                return None
+
+            if [] == db_session.read_transaction(self.get_computer_instance,host_smbsid):
+                logging.error("SMB Sid {0} was not found in the neo4j database".format(host_smbsid))
+                return None
+
+            # Skip deltas already applied or older than the ingested output, and snapshots older than the ingested output
+            # of the same state. A snapshot of another state (e.g. after the state file was lost) always replaces the edges
+            version = get_output_version(json_content)
+            if version is not None:
+                stored_version = db_session.read_transaction(self.get_computer_version, host_smbsid)
+                if is_stale_output(json_content, version, stored_version):
+                    logging.warning("Output {0} of {1} is older than the ingested output {2} and was ignored".format(version, host_name, stored_version))
+                    return None
+
+            # Mark the computer as a Mac, AdminTo edges alone do not tell Macs from the other computers
+            db_session.write_transaction(self.mark_machound_computer, host_smbsid)
+
+            # Delta documents are applied directly on top of the last ingested edges
+            if 'Delta' in json_content:
+                delta = json_content['Delta']
+                logging.info("Applying delta {0} for {1}".format(delta['Sequence'], host_name))
+                changes = db_session.write_transaction(self.apply_delta, host_smbsid, delta)
+                if changes is None:
+                    logging.error("Delta base hash {0} does not match the ingested edges of {1}, a full snapshot is required".format(delta['BaseHash'], host_name))
+                    self.resync_hosts.append(host_name)
+                elif changes:
+                    self.changed_computers.add(host_smbsid)
+                return None
+
+            # Add Sessions and Admin groups, duplicates were dropped by the edge set
+            for edge in sorted(edges):
+                object_type = edge.member.member_type.value
+                object_sid = edge.member.member_id
                 if [] == db_session.read_transaction(self.get_adobject_instance,object_sid, object_type):
                     logging.error("{0} with SMB Sid {1} was not found in the neo4j database".format(object_type, object_sid))
                     continue
-                db_session.write_transaction(self.add_user_connection, host_smbsid, object_sid, object_type, admin_type)
 
+                if MacHoundModel.EdgeType.HAS_SESSION is edge.edge_type:
+                    db_session.write_transaction(self.add_user_session, host_smbsid, object_sid)
+                else:
+                    if db_session.write_transaction(self.add_user_connection, host_smbsid, object_sid, object_type, edge.edge_type.value):
+                        self.changed_computers.add(host_smbsid)
 
-def run_ingestor(json_folder, neo4j_address, neo4j_auth):
+            # Remove the edges from earlier runs missing from the snapshot, and remember what snapshot was ingested so
+            # following deltas can be checked against it
+            if 'Hash' in json_content:
+                if db_session.write_transaction(self.replace_snapshot_edges, host_smbsid, json_content, edges):
+                    self.changed_computers.add(host_smbsid)
 
-    ingestor = MachoundIngestor(neo4j_address, neo4j_auth)
 
+def get_snapshot_edges(json_content):
+
+    '''
+     Get the edge set of a snapshot output, checking the edge types of empty AdminGroups lists as well.
+     Raises ValueError/KeyError/TypeError if the output is malformed.
+    '''
+
+    edges = MacHoundModel.get_edge_set(json_content)
+    for edge_type in json_content.get('AdminGroups', dict()):
+        MacHoundModel.EdgeType(edge_type)
+    return edges
+
+
+def read_collector_outputs(json_folder):
+
+    '''
+     Yield the collector outputs found under the folder one host at a time.
+    '''
+
+    # Walk in name order, so the outputs are read in the same order on every file system
     for root, dirs, files in os.walk(json_folder):
-        for file_name in files:
+        dirs.sort()
+        for file_name in sorted(files):
             full_path = os.path.join(root, file_name)
             logging.debug("Now parsing {0}".format(full_path))
             if not file_name.endswith("json"):
-                logging.warn("File {0} is not a json and was ignored".format(full_path))
-            with open(full_path,'r') as fp:
-                json_content = json.load(fp)
-                logging.debug("Json content was read successfully")
-            ingestor.parse_json(json_content)
+                logging.warning("File {0} is not a json and was ignored".format(full_path))
+                continue
+
+            # Batch collections are stored as NDJSON, one host per line
+            if file_name.endswith("ndjson"):
+                with open(full_path,'r') as fp:
+                    for line_number, line in enumerate(fp, 1):
+                        if not line.strip():
+                            continue
+                        try:
+                            json_content = json.loads(line)
+                        except ValueError as e:
+                            logging.error("Line {0} of {1} is not a valid json and was ignored - {2}".format(line_number, full_path, e))
+                            continue
+                        if isinstance(json_content, dict):
+                            yield json_content
+                        else:
+                            logging.error("Line {0} of {1} is not a collector output and was ignored".format(line_number, full_path))
+                continue
+
+            try:
+                with open(full_path,'r') as fp:
+                    json_content = json.load(fp)
+            except ValueError as e:
+                logging.error("File {0} is not a valid json and was ignored - {1}".format(full_path, e))
+                continue
+            if not isinstance(json_content, dict):
+                logging.error("File {0} is not a collector output and was ignored".format(full_path))
+                continue
+            logging.debug("Json content was read successfully")
+            yield json_content
+
+
+def get_output_version(json_content):
+
+    '''
+     Get the (epoch, sequence) of a stateful output, which orders the outputs of a host. The epoch is the creation
+     time of the collector state, so a new state (e.g. after the state file was lost) orders after the previous one.
+     Snapshots carry them at the top level, deltas inside the Delta part. Stateless outputs have none.
+    '''
+
+    version_content = json_content['Delta'] if 'Delta' in json_content else json_content
+    if version_content.get('Sequence') is None:
+        return None
+    return (version_content.get('Epoch') or 0, version_content['Sequence'])
+
+
+def is_stale_output(json_content, version, stored_version):
+
+    if stored_version is None:
+        return False
+
+    # Deltas are based on the previous output, so only a newer one can apply
+    if 'Delta' in json_content:
+        return version <= stored_version
+
+    # Snapshots replace all the edges of the host, only an older output of the same state is dropped
+    return version[0] == stored_version[0] and version[1] < stored_version[1]
+
+
+def read_ordered_outputs(json_folder):
+
+    '''
+     Yield the collector outputs found under the folder grouped per host and ordered by (epoch, sequence), so every
+     delta is applied after the output it is based on, whatever the file names and the walk order are.
+     Outputs older than the last snapshot of the same host are dropped as the snapshot replaces them.
+    '''
+
+    host_outputs = dict()
+    for json_content in read_collector_outputs(json_folder):
+        host_smbsid = json_content.get('Properties', dict()).get('objectid')
+        host_outputs.setdefault(host_smbsid, []).append(json_content)
+
+    for host_smbsid, outputs in host_outputs.items():
+        outputs.sort(key = lambda json_content: get_output_version(json_content) or (0, 0))
+
+        snapshot_versions = [get_output_version(json_content) for json_content in outputs if 'Delta' not in json_content]
+        last_snapshot = max([version for version in snapshot_versions if version is not None], default = None)
+        for json_content in outputs:
+            if last_snapshot is not None and (get_output_version(json_content) or (0, 0)) < last_snapshot:
+                logging.debug("Output {0} of {1} is superseded by snapshot {2}".format(get_output_version(json_content), host_smbsid, last_snapshot))
+                continue
+            yield json_content
+
+
+def run_ingestor(json_folder, neo4j_address, neo4j_auth, resync_file = None, precompute = None, precompute_rows_per_tx = PRECOMPUTE_ROWS_PER_TX):
+
+    ingestor = MachoundIngestor(neo4j_address, neo4j_auth)
+
+    for json_content in read_ordered_outputs(json_folder):
+        ingestor.parse_json(json_content)
+
+    # Optional post-ingest stage
+    if precompute:
+        ingestor.precompute_effective_access(only_changed = "changed" == precompute, rows_per_tx = precompute_rows_per_tx)
             
     ingestor.close_session()
 
+    # Report the hosts that should be collected again without --delta
+    if ingestor.resync_hosts:
+        logging.warning("{0} hosts require a full snapshot: {1}".format(len(ingestor.resync_hosts), ", ".join(ingestor.resync_hosts)))
+        if resync_file:
+            with open(resync_file,'w') as fp:
+                fp.write("\n".join(ingestor.resync_hosts) + "\n")
+
+
+def export_csv(json_folder, output_folder, csv_url_prefix = "file:///", rows_per_tx = CSV_ROWS_PER_TX):
+
+    '''
+     Export the collector outputs to relationship CSV files, one per edge type, and a Cypher script loading them.
+     Only the newest snapshot of every host is exported, with its edges deduplicated.
+    '''
+
+    os.makedirs(output_folder, exist_ok=True)
+    csv_files = dict()
+    csv_writers = dict()
+    exported_hosts = 0
+
+    try:
+        for edge_type in MacHoundModel.EdgeType:
+            csv_files[edge_type] = open(os.path.join(output_folder, edge_type.value + ".csv"), 'w', newline='')
+            csv_writers[edge_type] = csv.writer(csv_files[edge_type])
+            csv_writers[edge_type].writerow(CSV_HEADER)
+
+        for json_content in read_latest_snapshots(json_folder):
+            host_smbsid = json_content['Properties']['objectid']
+
+            # Parse all the edges of the host before writing any, so a malformed output skips the host only
+            try:
+                edges = get_snapshot_edges(json_content)
+            except (ValueError, KeyError, TypeError) as e:
+                logging.error("Output of {0} is malformed and was ignored - {1!r}".format(json_content['Properties'].get('name'), e))
+                continue
+            exported_hosts += 1
+
+            for edge in sorted(edges):
+                member_sid = edge.member.member_id
+                member_type = edge.member.member_type.value
+
+                # Sessions go from the computer to the user, all other edges go from the member to the computer
+                if MacHoundModel.EdgeType.HAS_SESSION is edge.edge_type:
+                    csv_writers[edge.edge_type].writerow([host_smbsid, member_sid, edge.edge_type.value, member_type])
+                else:
+                    csv_writers[edge.edge_type].writerow([member_sid, host_smbsid, edge.edge_type.value, member_type])
+    finally:
+        for csv_file in csv_files.values():
+            csv_file.close()
+
+    with open(os.path.join(output_folder, CSV_LOAD_SCRIPT_NAME), 'w') as fp:
+        fp.write(get_load_csv_script(csv_url_prefix, rows_per_tx))
+
+    logging.info("Exported {0} hosts to {1}".format(exported_hosts, output_folder))
+
+
+def read_latest_snapshots(json_folder):
+
+    '''
+     Get the newest snapshot of every host found under the folder, by (epoch, sequence) and for outputs without a
+     sequence by file name order. Delta documents cannot be bulk loaded and are skipped.
+    '''
+
+    latest_snapshots = dict()
+    for json_content in read_ordered_outputs(json_folder):
+        host_name = json_content.get('Properties', dict()).get('name')
+        host_smbsid = json_content.get('Properties', dict()).get('objectid')
+
+        if 'Delta' in json_content:
+            logging.warning("Delta output of {0} cannot be bulk exported and was ignored".format(host_name))
+            continue
+        if not host_smbsid:
+            logging.error("Host {0} has no SMB Sid and was ignored".format(host_name))
+            continue
+        if host_smbsid in latest_snapshots:
+            logging.info("Snapshot {0} of {1} replaces snapshot {2}".format(get_output_version(json_content), host_name,
+                                                                           get_output_version(latest_snapshots[host_smbsid])))
+        latest_snapshots[host_smbsid] = json_content
+
+    return list(latest_snapshots.values())
+
+
+def get_load_csv_script(csv_url_prefix = "file:///", rows_per_tx = CSV_ROWS_PER_TX):
+
+    # Labels cannot be parameters, so every edge type is loaded once per member type
+    statements = []
+    for edge_type in MacHoundModel.EdgeType:
+        csv_url = csv_url_prefix + edge_type.value + ".csv"
+        if MacHoundModel.EdgeType.HAS_SESSION is edge_type:
+            statements.append(LOAD_CSV_SESSIONS.format(**{"rows_per_tx":int(rows_per_tx),"csv_url":csv_url}))
+            continue
+        for member_type in MacHoundModel.MemberType:
+            statements.append(LOAD_CSV_RELATIONSHIPS.format(**{"rows_per_tx":int(rows_per_tx),"csv_url":csv_url,
+                                                               "ad_member_type":member_type.value,"connection_type":edge_type.value}))
+    return "\n".join(statements)
+
 
 def main():
 
@@ -141,6 +565,38 @@ def main():
                            default='neo4j',
                            help="Password to the neo4j database")
 
+    argparser.add_argument('-r',
+                           '--resyncfile',
+                           action='store',
+                           default=None,
+                           help="Path to write the hosts whose delta could not be applied and require a full snapshot")
+
+    argparser.add_argument('-c',
+                           '--precompute',
+                           action='store',
+                           choices=('changed','all'),
+                           default=None,
+                           help="After ingestion, precompute the effective (through nested groups) AdminTo/CanSSH/CanVNC/CanAE access of users as Effective* edges, "
+                                "for the computers changed in this run or for all computers")
+
+    argparser.add_argument('-b',
+                           '--batchsize',
+                           action='store',
+                           type=int,
+                           default=PRECOMPUTE_ROWS_PER_TX,
+                           help="Number of effective edges written per transaction by --precompute (default is {0})".format(PRECOMPUTE_ROWS_PER_TX))
+
+    argparser.add_argument('-e',
+                           '--exportcsv',
+                           action='store',
+                           default=None,
+                           help="Export the input folder to relationship CSV files and a Cypher load script in this folder, instead of ingesting to neo4j")
+
+    argparser.add_argument('--csvurl',
+                           action='store',
+                           default='file:///',
+                           help="URL prefix of the exported CSV files in the load script (default is file:/// for the neo4j import folder)")
+
     argparser.add_argument('-v',
                            action='store_true',
                            help='Enable verbose output')
@@ -148,8 +604,13 @@ def main():
     
     # Get commandline arguments
     args = argparser.parse_args()
+
+    if args.exportcsv:
+        export_csv(args.inputfolder, args.exportcsv, args.csvurl)
+        return
+
     neo4j_auth = (args.username,args.password)
-    run_ingestor(args.inputfolder, args.address, neo4j_auth)
+    run_ingestor(args.inputfolder, args.address, neo4j_auth, args.resyncfile, args.precompute, args.batchsize)
             
 
 if "__main__" == __name__:
@@ -0,0 +1,105 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import sys
+import time
+import types
+import logging
+import argparse
+import resource
+import tracemalloc
+
+# Memory and time of parsing an OpenDirectory tree and resolving the members of one group.
+# The collector folder is a parameter, so the same tree can be measured against an older checkout, e.g.
+#   git worktree add /tmp/machound_old <commit> && python bench_memory.py <tree> -c /tmp/machound_old/Collector
+
+class FakeSystemLib(object):
+
+    # The membership API only exists on macOS, SIDs are derived from the GUIDs instead
+    def uuid_to_sid(self, uuid):
+        return "S-1-5-21-1-2-3-" + str(int(uuid.replace("-", "")[:8], 16))
+
+def load_group_parser(collector_path):
+
+    system_lib_module = types.ModuleType("SystemLib")
+    system_lib_module.SystemLib = FakeSystemLib
+    sys.modules["SystemLib"] = system_lib_module
+    sys.path.insert(0, collector_path)
+
+    import GroupParser
+    return GroupParser
+
+def get_rss_mb():
+
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if "darwin" == sys.platform else max_rss / 1024
+
+def main():
+
+    argparser = argparse.ArgumentParser(add_help=True, description='Measure the memory of the MacHound OpenDirectory parser.')
+
+    argparser.add_argument('tree',
+                           action='store',
+                           help="Path to the tree holding the users and groups folders (see generate_tree.py)")
+
+    argparser.add_argument('-c',
+                           '--collector',
+                           action='store',
+                           default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Collector"),
+                           help="Path to the Collector folder to measure (default is the one of this checkout)")
+
+    argparser.add_argument('-g',
+                           '--group',
+                           action='store',
+                           default='admin',
+                           help="Group whose members are resolved (default is admin)")
+
+    args = argparser.parse_args()
+    logging.disable(logging.WARNING)
+    GroupParser = load_group_parser(args.collector)
+
+    tracemalloc.start()
+    start_time = time.time()
+    group_parser = GroupParser.GroupParser(FakeSystemLib(), os.path.join(args.tree, "groups"), os.path.join(args.tree, "users"))
+    parse_time = time.time() - start_time
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+
+    start_time = time.time()
+    members = group_parser.get_all_group_members(group_parser.get_group_by_name(args.group))
+    resolve_time = time.time() - start_time
+    _, resolve_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Older versions return the Active Directory members as a list of dicts
+    ad_members = {tuple(sorted(member.items())) if isinstance(member, dict) else member for member in members["activedirectory_sids"]}
+
+    print("Collector:          {0}".format(os.path.abspath(args.collector)))
+    print("Parser retained:    {0:.1f} MB".format(retained / 1e6))
+    print("Parse time:         {0:.2f} s".format(parse_time))
+    print("Resolve time:       {0:.2f} s".format(resolve_time))
+    print("Resolve peak:       {0:.1f} MB".format(max(resolve_peak - retained, 0) / 1e6))
+    print("Max RSS:            {0:.0f} MB".format(get_rss_mb()))
+    print("Local members:      {0}".format(len(members["local"])))
+    print("AD members:         {0}".format(len(ad_members)))
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,99 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import sys
+import time
+import logging
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Collector"))
+import GroupParser
+
+# Serial against parallel decoding of an OpenDirectory tree (see generate_tree.py, e.g. with --users 16000
+# --groups 4000 --photosize 2048). Every parallel parse is checked to give the same records as the serial one.
+
+class NoSystemLib(object):
+
+    # Parsing does not call the membership API, this only avoids loading the macOS libraries
+    pass
+
+def get_records(group_parser):
+
+    def dump(records_dict):
+        return [(record_name, tuple(getattr(record, slot) for slot in type(record).__slots__)) for record_name, record in records_dict.items()]
+
+    return dump(group_parser._users_dict), dump(group_parser._groups_dict), sorted(group_parser._users_by_guid), sorted(group_parser._groups_by_guid)
+
+def time_parse(tree_path, workers, repeat):
+
+    '''
+     Parse the tree repeat times and return the best time and the parsed records.
+    '''
+
+    best_time = None
+    for _ in range(repeat):
+        start_time = time.time()
+        group_parser = GroupParser.GroupParser(NoSystemLib(), os.path.join(tree_path, "groups"), os.path.join(tree_path, "users"),
+                                               workers = workers, parallel_threshold = 0)
+        elapsed = time.time() - start_time
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+    return best_time, get_records(group_parser)
+
+def main():
+
+    argparser = argparse.ArgumentParser(add_help=True, description='Measure the parallel OpenDirectory decoding of MacHound.')
+
+    argparser.add_argument('tree',
+                           action='store',
+                           help="Path to the tree holding the users and groups folders (see generate_tree.py)")
+
+    argparser.add_argument('-w',
+                           '--workers',
+                           action='store',
+                           type=int,
+                           nargs='+',
+                           default=[2, 4],
+                           help="Worker counts to measure (default is 2 4)")
+
+    argparser.add_argument('-r',
+                           '--repeat',
+                           action='store',
+                           type=int,
+                           default=3,
+                           help="Number of runs of each measurement, the best one is reported (default is 3)")
+
+    args = argparser.parse_args()
+    logging.disable(logging.WARNING)
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print("Usable CPUs:        {0}".format(cpus))
+
+    serial_time, serial_records = time_parse(args.tree, None, args.repeat)
+    print("Serial:             {0:.2f} s".format(serial_time))
+
+    for workers in args.workers:
+        parallel_time, parallel_records = time_parse(args.tree, workers, args.repeat)
+        print("{0:2d} workers:         {1:.2f} s  speedup {2:.2f}x  identical {3}".format(workers, parallel_time, serial_time / parallel_time,
+                                                                                       parallel_records == serial_records))
+
+
+if "__main__" == __name__:
+    multiprocessing.freeze_support()
+    main()
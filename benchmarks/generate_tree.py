@@ -0,0 +1,138 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import uuid
+import random
+import shutil
+import plistlib
+import argparse
+
+# Synthetic dslocal Default node for the benchmarks. The plists carry the fields OpenDirectory stores for real
+# records (home, shell, authentication authority, picture...) so decoding and memory costs are representative.
+# Group "admin" nests the first groups, which makes it the expensive group to resolve.
+
+def random_guid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128))).upper()
+
+def write_plist(folder_path, record_name, content):
+    with open(os.path.join(folder_path, record_name + ".plist"), 'wb') as fp:
+        plistlib.dump(content, fp, fmt=plistlib.FMT_BINARY)
+
+def generate_tree(output_path, users, groups, members, ad_members, nested, photo_size, seed):
+
+    rng = random.Random(seed)
+    users_path = os.path.join(output_path, "users")
+    groups_path = os.path.join(output_path, "groups")
+    shutil.rmtree(output_path, ignore_errors=True)
+    os.makedirs(users_path)
+    os.makedirs(groups_path)
+
+    user_guids = [random_guid(rng) for _ in range(users)]
+    ad_guids = [random_guid(rng) for _ in range(ad_members * 100)]
+    group_guids = [random_guid(rng) for _ in range(groups)]
+
+    for i, user_guid in enumerate(user_guids):
+        user_name = "user{0}".format(i)
+        content = {"name": [user_name],
+                   "generateduid": [user_guid],
+                   "uid": [str(1000 + i)],
+                   "home": ["/Users/" + user_name],
+                   "shell": ["/bin/zsh"],
+                   "realname": ["User {0}".format(i)],
+                   "authentication_authority": [";Kerberosv5;;{0}@CORP;CORP.LOCAL;".format(user_name)],
+                   "picture": ["/Library/User Pictures/Animals/Eagle.heic"]}
+        if photo_size:
+            content["jpegphoto"] = [rng.getrandbits(8 * photo_size).to_bytes(photo_size, "little")]
+
+        # Every other user is a mobile (cached Active Directory) account
+        if i % 2:
+            content["original_node_name"] = ["/Active Directory/CORP/All Domains"]
+        write_plist(users_path, user_name, content)
+
+    for i, group_guid in enumerate(group_guids):
+        group_name = "admin" if 0 == i else "group{0}".format(i)
+        content = {"name": [group_name],
+                   "generateduid": [group_guid],
+                   "gid": [str(i)],
+                   "realname": [group_name],
+                   "groupmembers": rng.sample(user_guids, min(members, users)) + rng.sample(ad_guids, min(ad_members, len(ad_guids))),
+                   "users": ["user{0}".format(j) for j in range(min(members, users))]}
+        if 0 == i:
+            content["nestedgroups"] = group_guids[1:nested + 1]
+        write_plist(groups_path, group_name, content)
+
+def main():
+
+    argparser = argparse.ArgumentParser(add_help=True, description='Generate a synthetic OpenDirectory tree for the MacHound benchmarks.')
+
+    argparser.add_argument('-o',
+                           '--output',
+                           action='store',
+                           default='./bench_tree',
+                           help="Path to the generated tree, holding the users and groups folders (default is ./bench_tree)")
+
+    argparser.add_argument('--users',
+                           action='store',
+                           type=int,
+                           default=5000,
+                           help="Number of local users (default is 5000)")
+
+    argparser.add_argument('--groups',
+                           action='store',
+                           type=int,
+                           default=500,
+                           help="Number of local groups (default is 500)")
+
+    argparser.add_argument('--members',
+                           action='store',
+                           type=int,
+                           default=50,
+                           help="Number of local users in each group (default is 50)")
+
+    argparser.add_argument('--admembers',
+                           action='store',
+                           type=int,
+                           default=200,
+                           help="Number of Active Directory members in each group (default is 200)")
+
+    argparser.add_argument('--nested',
+                           action='store',
+                           type=int,
+                           default=300,
+                           help="Number of groups nested in the admin group (default is 300)")
+
+    argparser.add_argument('--photosize',
+                           action='store',
+                           type=int,
+                           default=0,
+                           help="Size in bytes of the jpegphoto stored in every user plist (default is no photo)")
+
+    argparser.add_argument('--seed',
+                           action='store',
+                           type=int,
+                           default=1,
+                           help="Random seed, the same seed generates the same tree (default is 1)")
+
+    args = argparser.parse_args()
+    generate_tree(args.output, args.users, args.groups, args.members, args.admembers, args.nested, args.photosize, args.seed)
+    print("Generated {0} users and {1} groups in {2}".format(args.users, args.groups, args.output))
+
+
+if "__main__" == __name__:
+    main()
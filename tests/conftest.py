@@ -0,0 +1,81 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import sys
+import plistlib
+import pytest
+
+# The collector and the ingestor are flat script folders, not packages. Both ship the same MacHoundModel
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO_ROOT, "Ingestor"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "Collector"))
+
+class StubSystemLib(object):
+
+    '''
+     Replacement of SystemLib, the membership API and the utmpx database only exist on macOS.
+     SIDs are derived from the GUIDs and the GUI sessions are set by the test.
+    '''
+
+    def __init__(self):
+        self.sessions = []
+
+    def uuid_to_sid(self, uuid):
+        return "S-" + uuid
+
+    def get_gui_sessions(self):
+        return list(self.sessions)
+
+class ODTree(object):
+
+    '''
+     Minimal dslocal Default node holding users and groups plists, as written by OpenDirectory.
+    '''
+
+    def __init__(self, root_path):
+        self.users_dir = os.path.join(root_path, "users")
+        self.groups_dir = os.path.join(root_path, "groups")
+        os.makedirs(self.users_dir)
+        os.makedirs(self.groups_dir)
+
+    def write_user(self, name, guid, mobile = False):
+        content = {"name": [name], "generateduid": [guid], "home": ["/Users/" + name]}
+        if mobile:
+            content["original_node_name"] = ["/Active Directory/CORP/All Domains"]
+        self._write_plist(self.users_dir, name, content)
+
+    def write_group(self, name, guid, members = (), nested_groups = ()):
+        self._write_plist(self.groups_dir, name, {"name": [name], "generateduid": [guid],
+                                                  "groupmembers": list(members), "nestedgroups": list(nested_groups)})
+
+    def remove_group(self, name):
+        os.remove(os.path.join(self.groups_dir, name + ".plist"))
+
+    @staticmethod
+    def _write_plist(folder_path, name, content):
+        with open(os.path.join(folder_path, name + ".plist"), 'wb') as fp:
+            plistlib.dump(content, fp, fmt=plistlib.FMT_BINARY)
+
+@pytest.fixture
+def system_lib():
+    return StubSystemLib()
+
+@pytest.fixture
+def od_tree(tmp_path):
+    return ODTree(str(tmp_path / "Default"))
@@ -0,0 +1,79 @@
+LOAD CSV WITH HEADERS FROM 'file:///HasSession.csv' AS row
+CALL {
+  WITH row
+  MATCH (a:Computer { objectid: row.start_sid }),(b:User { objectid: row.end_sid })
+  MERGE (a)-[r:HasSession]->(b)
+  SET a.machound = true
+} IN TRANSACTIONS OF 1000 ROWS;
+
+LOAD CSV WITH HEADERS FROM 'file:///AdminTo.csv' AS row
+WITH row WHERE row.member_type = 'User'
+CALL {
+  WITH row
+  MATCH (a:Computer { objectid: row.end_sid }),(b:User { objectid: row.start_sid })
+  MERGE (b)-[r:AdminTo]->(a)
+  SET a.machound = true
+} IN TRANSACTIONS OF 1000 ROWS;
+
+LOAD CSV WITH HEADERS FROM 'file:///AdminTo.csv' AS row
+WITH row WHERE row.member_type = 'Group'
+CALL {
+  WITH row
+  MATCH (a:Computer { objectid: row.end_sid }),(b:Group { objectid: row.start_sid })
+  MERGE (b)-[r:AdminTo]->(a)
+  SET a.machound = true
+} IN TRANSACTIONS OF 1000 ROWS;
+
+LOAD CSV WITH HEADERS FROM 'file:///CanSSH.csv' AS row
+WITH row WHERE row.member_type = 'User'
+CALL {
+  WITH row
+  MATCH (a:Computer { objectid: row.end_sid }),(b:User { objectid: row.start_sid })
+  MERGE (b)-[r:CanSSH]->(a)
+  SET a.machound = true
+} IN TRANSACTIONS OF 1000 ROWS;
+
+LOAD CSV WITH HEADERS FROM 'file:///CanSSH.csv' AS row
+WITH row WHERE row.member_type = 'Group'
+CALL {
+  WITH row
+  MATCH (a:Computer { objectid: row.end_sid }),(b:Group { objectid: row.start_sid })
+  MERGE (b)-[r:CanSSH]->(a)
+  SET a.machound = true
+} IN TRANSACTIONS OF 1000 ROWS;
+
+LOAD CSV WITH HEADERS FROM 'file:///CanVNC.csv' AS row
+WITH row WHERE row.member_type = 'User'
+CALL {
+  WITH row
+  MATCH (a:Computer { objectid: row.end_sid }),(b:User { objectid: row.start_sid })
+  MERGE (b)-[r:CanVNC]->(a)
+  SET a.machound = true
+} IN TRANSACTIONS OF 1000 ROWS;
+
+LOAD CSV WITH HEADERS FROM 'file:///CanVNC.csv' AS row
+WITH row WHERE row.member_type = 'Group'
+CALL {
+  WITH row
+  MATCH (a:Computer { objectid: row.end_sid }),(b:Group { objectid: row.start_sid })
+  MERGE (b)-[r:CanVNC]->(a)
+  SET a.machound = true
+} IN TRANSACTIONS OF 1000 ROWS;
+
+LOAD CSV WITH HEADERS FROM 'file:///CanAE.csv' AS row
+WITH row WHERE row.member_type = 'User'
+CALL {
+  WITH row
+  MATCH (a:Computer { objectid: row.end_sid }),(b:User { objectid: row.start_sid })
+  MERGE (b)-[r:CanAE]->(a)
+  SET a.machound = true
+} IN TRANSACTIONS OF 1000 ROWS;
+
+LOAD CSV WITH HEADERS FROM 'file:///CanAE.csv' AS row
+WITH row WHERE row.member_type = 'Group'
+CALL {
+  WITH row
+  MATCH (a:Computer { objectid: row.end_sid }),(b:Group { objectid: row.start_sid })
+  MERGE (b)-[r:CanAE]->(a)
+  SET a.machound = true
+} IN TRANSACTIONS OF 1000 ROWS;
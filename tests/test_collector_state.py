@@ -0,0 +1,156 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import json
+import itertools
+import pytest
+import GroupParser
+import MacHound
+import MacHoundModel
+
+HOST_PROPERTIES = {"objectid": "S-1-5-21-1-2-3-1001", "name": "MAC1.CORP.LOCAL"}
+
+@pytest.fixture
+def epochs(monkeypatch):
+
+    # Epochs are millisecond timestamps, successive states in a test must not share one
+    counter = itertools.count(1000)
+    monkeypatch.setattr(MacHound.MacHound, "_new_epoch", staticmethod(lambda: next(counter)))
+
+@pytest.fixture
+def output_folder(tmp_path):
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+    return output_path
+
+def run_collector(od_tree, system_lib, output_folder, emit_delta = True):
+
+    # Every run is a new process in practice, only the state file is shared between runs
+    group_parser = GroupParser.GroupParser(system_lib, od_tree.groups_dir, od_tree.users_dir)
+    machound = MacHound.MacHound(edges_to_parse = ("AdminTo",),
+                                 output_path = str(output_folder / "output.json"),
+                                 state_path = str(output_folder / "state.json"),
+                                 emit_delta = emit_delta,
+                                 system_lib = system_lib,
+                                 group_parser = group_parser,
+                                 properties = dict(HOST_PROPERTIES))
+    machound.start()
+    return machound
+
+def read_outputs(output_folder):
+    return {file_name: json.loads((output_folder / file_name).read_text()) for file_name in os.listdir(str(output_folder)) if file_name != "state.json"}
+
+def test_first_run_writes_snapshot(od_tree, system_lib, output_folder, epochs):
+
+    od_tree.write_group("admin", "G-ADMIN", members = ["AD-USER-1"], nested_groups = ["AD-GROUP-1"])
+    run_collector(od_tree, system_lib, output_folder)
+
+    outputs = read_outputs(output_folder)
+    assert list(outputs) == ["output.1000.000001.json"]
+
+    snapshot = outputs["output.1000.000001.json"]
+    edges = MacHoundModel.get_edge_set(snapshot)
+    assert edges == {MacHoundModel.Edge("AdminTo", MacHoundModel.Member("S-AD-USER-1", "User")),
+                     MacHoundModel.Edge("AdminTo", MacHoundModel.Member("S-AD-GROUP-1", "Group"))}
+    assert (snapshot['Epoch'], snapshot['Sequence'], snapshot['Hash']) == (1000, 1, MacHound.MacHound._get_edge_hash(edges))
+
+    state = json.loads((output_folder / "state.json").read_text())
+    assert (state['Epoch'], state['Sequence'], state['Hash']) == (1000, 1, snapshot['Hash'])
+    assert MacHoundModel.get_edge_set(state) == edges
+
+def test_next_run_writes_delta(od_tree, system_lib, output_folder, epochs):
+
+    od_tree.write_group("admin", "G-ADMIN", members = ["AD-USER-1", "AD-USER-2"])
+    run_collector(od_tree, system_lib, output_folder)
+    od_tree.write_group("admin", "G-ADMIN", members = ["AD-USER-1", "AD-USER-3"])
+    run_collector(od_tree, system_lib, output_folder)
+
+    outputs = read_outputs(output_folder)
+    assert sorted(outputs) == ["output.1000.000001.json", "output.1000.000002.json"]
+
+    snapshot = outputs["output.1000.000001.json"]
+    delta = outputs["output.1000.000002.json"]['Delta']
+    assert (delta['Epoch'], delta['Sequence'], delta['BaseHash']) == (1000, 2, snapshot['Hash'])
+    assert delta['Added'] == {"Sessions": [], "AdminGroups": {"AdminTo": [{"MemberId": "S-AD-USER-3", "MemberType": "User"}]}}
+    assert delta['Removed'] == {"Sessions": [], "AdminGroups": {"AdminTo": [{"MemberId": "S-AD-USER-2", "MemberType": "User"}]}}
+
+    # Applying the delta on the snapshot gives the edges the delta hash was computed on
+    edges = (MacHoundModel.get_edge_set(snapshot) - MacHoundModel.get_edge_set(delta['Removed'])) | MacHoundModel.get_edge_set(delta['Added'])
+    assert delta['Hash'] == MacHound.MacHound._get_edge_hash(edges)
+
+def test_unchanged_run_writes_no_delta(od_tree, system_lib, output_folder, epochs):
+
+    od_tree.write_group("admin", "G-ADMIN", members = ["AD-USER-1"])
+    run_collector(od_tree, system_lib, output_folder)
+    run_collector(od_tree, system_lib, output_folder)
+
+    assert list(read_outputs(output_folder)) == ["output.1000.000001.json"]
+    assert 1 == json.loads((output_folder / "state.json").read_text())['Sequence']
+
+def test_snapshot_without_delta_continues_the_sequence(od_tree, system_lib, output_folder, epochs):
+
+    od_tree.write_group("admin", "G-ADMIN", members = ["AD-USER-1"])
+    run_collector(od_tree, system_lib, output_folder, emit_delta = False)
+    run_collector(od_tree, system_lib, output_folder, emit_delta = False)
+
+    outputs = read_outputs(output_folder)
+    assert sorted(outputs) == ["output.1000.000001.json", "output.1000.000002.json"]
+    assert 'Delta' not in outputs["output.1000.000002.json"]
+
+@pytest.mark.parametrize("state_content", [None, "{\"Sequence\": 1", "{\"Sequence\": 1, \"Hash\": \"abc\"}"])
+def test_lost_state_writes_snapshot_of_new_epoch(od_tree, system_lib, output_folder, epochs, state_content):
+
+    od_tree.write_group("admin", "G-ADMIN", members = ["AD-USER-1"])
+    run_collector(od_tree, system_lib, output_folder)
+    first_snapshot = (output_folder / "output.1000.000001.json").read_text()
+
+    # Missing, truncated, or written before epochs were introduced
+    if state_content is None:
+        os.remove(str(output_folder / "state.json"))
+    else:
+        (output_folder / "state.json").write_text(state_content)
+    run_collector(od_tree, system_lib, output_folder)
+
+    outputs = read_outputs(output_folder)
+    assert sorted(outputs) == ["output.1000.000001.json", "output.1001.000001.json"]
+    assert (output_folder / "output.1000.000001.json").read_text() == first_snapshot
+
+    snapshot = outputs["output.1001.000001.json"]
+    assert 'Delta' not in snapshot
+    assert (snapshot['Epoch'], snapshot['Sequence']) == (1001, 1)
+
+def test_edge_content_round_trip():
+
+    json_content = {"Sessions": ["S-USER-2", "S-USER-1", "S-USER-1"],
+                    "AdminGroups": {"AdminTo": [{"MemberId": "S-GROUP-1", "MemberType": "Group"}, {"MemberId": "S-USER-1", "MemberType": "User"}],
+                                    "CanSSH": [{"MemberId": "S-USER-1", "MemberType": "User"}]}}
+
+    edges = MacHoundModel.get_edge_set(json_content)
+    assert 5 == len(edges)
+
+    edge_content = MacHoundModel.get_edge_content(edges)
+    assert edge_content == {"Sessions": ["S-USER-1", "S-USER-2"],
+                            "AdminGroups": {"AdminTo": [{"MemberId": "S-GROUP-1", "MemberType": "Group"}, {"MemberId": "S-USER-1", "MemberType": "User"}],
+                                            "CanSSH": [{"MemberId": "S-USER-1", "MemberType": "User"}]}}
+    assert MacHoundModel.get_edge_set(edge_content) == edges
+
+def test_edge_hash_does_not_depend_on_order():
+
+    edges = [MacHoundModel.Edge("AdminTo", MacHoundModel.Member("S-USER-{0}".format(i), "User")) for i in range(5)]
+    assert MacHound.MacHound._get_edge_hash(edges) == MacHound.MacHound._get_edge_hash(list(reversed(edges)))
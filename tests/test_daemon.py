@@ -0,0 +1,162 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import json
+import pytest
+import GroupParser
+import SystemLib
+import MacHound
+import ChangeWatcher
+
+HOST_PROPERTIES = {"objectid": "S-1-5-21-1-2-3-1001", "name": "MAC1.CORP.LOCAL"}
+
+class StopDaemon(Exception):
+    pass
+
+@pytest.fixture
+def daemon_tree(od_tree, tmp_path, monkeypatch):
+
+    '''
+     admin (AdminTo) nests the local group staff-a, com.apple.access_ssh (CanSSH) nests the local group staff-b.
+     The watcher watches the fixed OpenDirectory paths, they are pointed to the temporary tree.
+    '''
+
+    od_tree.write_user("alice", "U-ALICE", mobile = True)
+    od_tree.write_group("staff-a", "G-STAFF-A", members = ["AD-USER-1"])
+    od_tree.write_group("staff-b", "G-STAFF-B", members = ["AD-USER-2"], nested_groups = ["AD-GROUP-2"])
+    od_tree.write_group("admin", "G-ADMIN", nested_groups = ["G-STAFF-A"])
+    od_tree.write_group("com.apple.access_ssh", "G-SSH", nested_groups = ["G-STAFF-B"])
+    od_tree.write_group("other", "G-OTHER", members = ["AD-USER-9"])
+
+    utmpx_path = tmp_path / "utmpx"
+    utmpx_path.write_bytes(b"")
+    monkeypatch.setattr(GroupParser, "OD_GROUPS_FOLDER", od_tree.groups_dir)
+    monkeypatch.setattr(GroupParser, "OD_USERS_FOLDER", od_tree.users_dir)
+    monkeypatch.setattr(SystemLib, "UTMPX_FILE", str(utmpx_path))
+    od_tree.utmpx_path = utmpx_path
+    return od_tree
+
+def run_daemon(daemon_tree, system_lib, output_path, tree_changes):
+
+    '''
+     Run the daemon loop, applying one change to the tree before each wakeup, and stop once all the changes were seen.
+     Returns the daemon and the edge types recomputed at each wakeup.
+    '''
+
+    machound = MacHound.MacHound(edges_to_parse = ("HasSession", "AdminTo", "CanSSH"),
+                                 output_path = str(output_path),
+                                 system_lib = system_lib,
+                                 group_parser = GroupParser.GroupParser(system_lib, daemon_tree.groups_dir, daemon_tree.users_dir),
+                                 properties = dict(HOST_PROPERTIES),
+                                 watch_interval = 0)
+
+    recomputed = []
+    get_administrative_group = machound._get_administrative_group
+    def spy_administrative_group(bh_connetion):
+        recomputed[-1].append(bh_connetion)
+        return get_administrative_group(bh_connetion)
+    machound._get_administrative_group = spy_administrative_group
+
+    # Poll the tree on every wakeup, the changes are made right before it
+    machound._watcher._use_kqueue = False
+    pending_changes = list(tree_changes)
+    wait_for_changes = machound._watcher.wait_for_changes
+    def apply_next_change():
+        if not pending_changes:
+            raise StopDaemon()
+        pending_changes.pop(0)()
+        recomputed.append([])
+        return wait_for_changes()
+    machound._watcher.wait_for_changes = apply_next_change
+
+    # The initial collection is not a wakeup
+    recomputed.append([])
+    with pytest.raises(StopDaemon):
+        machound.watch()
+    return machound, recomputed[1:]
+
+def read_output(output_path):
+    with open(str(output_path), 'r') as fp:
+        return json.load(fp)
+
+def test_nested_group_change_recomputes_its_closure_only(daemon_tree, system_lib, tmp_path):
+
+    output_path = tmp_path / "output.json"
+    outputs = []
+
+    def change_staff_a():
+        daemon_tree.write_group("staff-a", "G-STAFF-A", members = ["AD-USER-1", "AD-USER-10"])
+
+    def read_initial_output():
+        outputs.append(read_output(output_path))
+
+    machound, recomputed = run_daemon(daemon_tree, system_lib, output_path, [read_initial_output, change_staff_a])
+
+    assert recomputed == [[], ["AdminTo"]]
+    assert outputs[0]['AdminGroups']['AdminTo'] == [{"MemberId": "S-AD-USER-1", "MemberType": "User"}]
+
+    output = read_output(output_path)
+    assert sorted(member['MemberId'] for member in output['AdminGroups']['AdminTo']) == ["S-AD-USER-1", "S-AD-USER-10"]
+    assert output['AdminGroups']['CanSSH'] == outputs[0]['AdminGroups']['CanSSH']
+    assert output['Sessions'] == outputs[0]['Sessions'] == []
+
+    # The output is replaced, no temporary file is left behind
+    assert sorted(os.listdir(str(tmp_path))) == ["Default", "output.json", "utmpx"]
+
+def test_unrelated_change_does_not_rewrite_output(daemon_tree, system_lib, tmp_path):
+
+    output_path = tmp_path / "output.json"
+
+    def change_other():
+        daemon_tree.write_group("other", "G-OTHER", members = ["AD-USER-9", "AD-USER-99"])
+
+    def remove_output():
+        os.remove(str(output_path))
+
+    machound, recomputed = run_daemon(daemon_tree, system_lib, output_path, [remove_output, change_other])
+
+    assert recomputed == [[], []]
+    assert not output_path.exists()
+
+def test_session_change_does_not_recompute_groups(daemon_tree, system_lib, tmp_path):
+
+    output_path = tmp_path / "output.json"
+
+    def login_alice():
+        system_lib.sessions = [("alice", 0)]
+        daemon_tree.utmpx_path.write_bytes(b"alice")
+
+    machound, recomputed = run_daemon(daemon_tree, system_lib, output_path, [login_alice])
+
+    assert recomputed == [[]]
+    assert read_output(output_path)['Sessions'] == ["S-U-ALICE"]
+
+def test_watcher_reports_changed_records(daemon_tree):
+
+    watcher = ChangeWatcher.ChangeWatcher(daemon_tree.groups_dir, daemon_tree.users_dir, session_files = [str(daemon_tree.utmpx_path)], interval = 0)
+    watcher._use_kqueue = False
+    assert watcher.wait_for_changes() is None
+
+    daemon_tree.write_group("staff-b", "G-STAFF-B", members = ["AD-USER-2", "AD-USER-20"])
+    daemon_tree.remove_group("other")
+    daemon_tree.write_user("bob", "U-BOB")
+    assert watcher.wait_for_changes() == {"groups": {"staff-b", "other"}, "users": {"bob"}, "sessions": False}
+
+    daemon_tree.utmpx_path.write_bytes(b"bob")
+    assert watcher.wait_for_changes() == {"groups": set(), "users": set(), "sessions": True}
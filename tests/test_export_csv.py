@@ -0,0 +1,40 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import db_inserter
+
+# The input holds a stateless output, sequenced snapshots and a delta of one host across two state epochs (only the
+# newest snapshot is exported), a batch NDJSON with a host without SMB Sid and malformed outputs (unknown member or
+# edge type, no Properties, invalid json), and files which are not outputs. Malformed outputs skip their host only.
+# To update the expected files after an intended format change, run export_csv on the input into the expected folder.
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "export_csv")
+
+def test_export_csv_matches_golden_files(tmp_path):
+
+    db_inserter.export_csv(os.path.join(FIXTURE_PATH, "input"), str(tmp_path))
+
+    expected_path = os.path.join(FIXTURE_PATH, "expected")
+    assert sorted(os.listdir(str(tmp_path))) == sorted(os.listdir(expected_path))
+
+    for file_name in os.listdir(expected_path):
+        with open(os.path.join(expected_path, file_name), 'rb') as fp:
+            expected_content = fp.read()
+        with open(os.path.join(str(tmp_path), file_name), 'rb') as fp:
+            exported_content = fp.read()
+        assert exported_content == expected_content, "{0} differs from the golden file".format(file_name)
@@ -0,0 +1,71 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import sys
+import pytest
+import GroupParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import generate_tree
+
+def get_records(group_parser):
+
+    # Every slot of every record, in the dictionaries order, and both GUID indexes
+    def dump(records_dict):
+        return [(record_name, tuple(getattr(record, slot) for slot in type(record).__slots__)) for record_name, record in records_dict.items()]
+
+    def dump_index(guid_index):
+        return [(guid, record.name) for guid, record in guid_index.items()]
+
+    return (dump(group_parser._users_dict), dump(group_parser._groups_dict),
+            dump_index(group_parser._users_by_guid), dump_index(group_parser._groups_by_guid))
+
+@pytest.fixture
+def generated_tree(tmp_path):
+    tree_path = str(tmp_path / "Default")
+    generate_tree.generate_tree(tree_path, users = 300, groups = 60, members = 5, ad_members = 2, nested = 5, photo_size = 16, seed = 1)
+    return tree_path
+
+def parse_tree(tree_path, system_lib, **kwargs):
+    return GroupParser.GroupParser(system_lib, os.path.join(tree_path, "groups"), os.path.join(tree_path, "users"), **kwargs)
+
+def test_parallel_parse_matches_serial_parse(generated_tree, system_lib, monkeypatch):
+
+    # Small chunks so every folder is split across several workers and the chunk order matters
+    monkeypatch.setattr(GroupParser, "PARALLEL_CHUNK_SIZE", 16)
+
+    serial_parser = parse_tree(generated_tree, system_lib)
+    parallel_parser = parse_tree(generated_tree, system_lib, workers = 2, parallel_threshold = 0)
+
+    serial_records = get_records(serial_parser)
+    assert (300, 60) == (len(serial_records[0]), len(serial_records[1]))
+    assert get_records(parallel_parser) == serial_records
+
+    admin_group = serial_parser.get_group_by_name("admin")
+    assert parallel_parser.get_all_group_members(parallel_parser.get_group_by_name("admin")) == serial_parser.get_all_group_members(admin_group)
+
+def test_parallel_parse_below_threshold_is_serial(generated_tree, system_lib, monkeypatch):
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The process pool must not be started below the threshold")
+
+    monkeypatch.setattr(GroupParser.concurrent.futures, "ProcessPoolExecutor", fail)
+    parallel_parser = parse_tree(generated_tree, system_lib, workers = 2)
+
+    assert get_records(parallel_parser) == get_records(parse_tree(generated_tree, system_lib))
@@ -0,0 +1,78 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import json
+import pytest
+import db_inserter
+
+def snapshot(host_smbsid, epoch, sequence):
+    return {"Properties": {"objectid": host_smbsid, "name": host_smbsid}, "Epoch": epoch, "Sequence": sequence, "Hash": "H", "AdminGroups": {}}
+
+def delta(host_smbsid, epoch, sequence):
+    return {"Properties": {"objectid": host_smbsid, "name": host_smbsid},
+            "Delta": {"Epoch": epoch, "Sequence": sequence, "BaseHash": "H", "Hash": "H", "Added": {}, "Removed": {}}}
+
+def write_outputs(folder_path, outputs):
+
+    # File names deliberately do not follow the output order
+    for i, json_content in enumerate(outputs):
+        (folder_path / "{0:02d}.json".format(len(outputs) - i)).write_text(json.dumps(json_content))
+
+def read_versions(folder_path):
+    return [(json_content['Properties']['objectid'], db_inserter.get_output_version(json_content)) for json_content in db_inserter.read_ordered_outputs(str(folder_path))]
+
+def test_outputs_are_ordered_per_host(tmp_path):
+
+    write_outputs(tmp_path, [delta("S-1", 100, 3), delta("S-2", 100, 2), snapshot("S-1", 100, 1), delta("S-1", 100, 2), snapshot("S-2", 100, 1)])
+
+    versions = read_versions(tmp_path)
+    assert [version for version in versions if "S-1" == version[0]] == [("S-1", (100, 1)), ("S-1", (100, 2)), ("S-1", (100, 3))]
+    assert [version for version in versions if "S-2" == version[0]] == [("S-2", (100, 1)), ("S-2", (100, 2))]
+
+def test_last_snapshot_supersedes_older_outputs(tmp_path):
+
+    write_outputs(tmp_path, [snapshot("S-1", 100, 1), delta("S-1", 100, 2), snapshot("S-1", 100, 3), delta("S-1", 100, 4)])
+    assert read_versions(tmp_path) == [("S-1", (100, 3)), ("S-1", (100, 4))]
+
+def test_new_epoch_supersedes_higher_sequences_of_old_epoch(tmp_path):
+
+    # The state was lost after output 7, the collector started again at sequence 1
+    write_outputs(tmp_path, [snapshot("S-1", 100, 6), delta("S-1", 100, 7), snapshot("S-1", 200, 1), delta("S-1", 200, 2)])
+    assert read_versions(tmp_path) == [("S-1", (200, 1)), ("S-1", (200, 2))]
+
+def test_stateless_outputs_are_kept(tmp_path):
+
+    (tmp_path / "mac.json").write_text(json.dumps({"Properties": {"objectid": "S-1", "name": "S-1"}, "AdminGroups": {}}))
+    assert read_versions(tmp_path) == [("S-1", None)]
+
+@pytest.mark.parametrize("json_content, version, stored_version, stale", [
+    (snapshot("S-1", 100, 5), (100, 5), None, False),
+    (snapshot("S-1", 100, 3), (100, 3), (100, 5), True),
+    (snapshot("S-1", 100, 5), (100, 5), (100, 5), False),
+    # A snapshot of a new state is ingested even if its sequence is lower, it replaces all the edges
+    (snapshot("S-1", 200, 1), (200, 1), (100, 5), False),
+    (delta("S-1", 100, 5), (100, 5), (100, 5), True),
+    (delta("S-1", 100, 4), (100, 4), (100, 5), True),
+    (delta("S-1", 100, 6), (100, 6), (100, 5), False),
+    (delta("S-1", 200, 2), (200, 2), (100, 5), False),
+    (delta("S-1", 50, 9), (50, 9), (100, 5), True),
+])
+def test_stale_outputs(json_content, version, stored_version, stale):
+
+    assert db_inserter.get_output_version(json_content) == version
+    assert db_inserter.is_stale_output(json_content, version, stored_version) is stale
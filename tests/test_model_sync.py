@@ -0,0 +1,31 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def test_model_copies_are_identical():
+
+    # The collector and the ingestor ship their own copy of the shared model
+    with open(os.path.join(REPO_ROOT, "Collector", "MacHoundModel.py"), 'rb') as fp:
+        collector_model = fp.read()
+    with open(os.path.join(REPO_ROOT, "Ingestor", "MacHoundModel.py"), 'rb') as fp:
+        ingestor_model = fp.read()
+
+    assert collector_model == ingestor_model, "Ingestor/MacHoundModel.py is out of sync with Collector/MacHoundModel.py"
@@ -0,0 +1,135 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import uuid
+import json
+import pytest
+import db_inserter
+
+# Runs the ingestor Cypher against a disposable Neo4j 4.4+ database, only when its URL is given (see the README).
+# The CSV load test also needs the local folder mounted as the database import folder.
+NEO4J_URL = os.environ.get("MACHOUND_TEST_NEO4J_URL")
+NEO4J_AUTH = (os.environ.get("MACHOUND_TEST_NEO4J_USER", "neo4j"), os.environ.get("MACHOUND_TEST_NEO4J_PASSWORD", ""))
+NEO4J_IMPORT_DIR = os.environ.get("MACHOUND_TEST_NEO4J_IMPORT_DIR")
+
+pytestmark = pytest.mark.skipif(not NEO4J_URL or db_inserter.neo4j is None, reason="MACHOUND_TEST_NEO4J_URL is not set or the neo4j driver is not installed")
+
+CREATE_NODES = "UNWIND $sids AS sid CREATE (:{label} {{ objectid: sid, name: sid }})"
+CREATE_MEMBER_OF = "UNWIND $pairs AS pair MATCH (a { objectid: pair[0] }),(b:Group { objectid: pair[1] }) CREATE (a)-[:MemberOf]->(b)"
+DELETE_MEMBER_OF = "MATCH (a { objectid: $member_sid })-[r:MemberOf]->(b:Group { objectid: $group_sid }) DELETE r"
+GET_EDGE_SOURCES = "MATCH (m)-[:{edge_type}]->(c:Computer {{ objectid: $computer_sid }}) RETURN m.objectid AS sid"
+GET_SESSION_TARGETS = "MATCH (c:Computer { objectid: $computer_sid })-[:HasSession]->(u:User) RETURN u.objectid AS sid"
+GET_MACHOUND_MARK = "MATCH (c:Computer { objectid: $computer_sid }) RETURN c.machound AS machound"
+DELETE_TEST_NODES = "MATCH (n) WHERE n.objectid STARTS WITH $prefix DETACH DELETE n"
+
+@pytest.fixture
+def graph():
+
+    '''
+     Small nested group graph, under a random SID prefix so the test data can be removed from a shared database:
+     USER1 -> GROUP1 -> GROUP2 -> GROUP3 and USER2 -> GROUP2. USER3 and USER4 are in no group.
+     MAC1 is collected by MacHound, MAC2 is another computer.
+    '''
+
+    prefix = "S-1-5-21-{0}-".format(uuid.uuid4().int % 10 ** 9)
+    sids = {name: prefix + name for name in ("MAC1", "MAC2", "USER1", "USER2", "USER3", "USER4", "GROUP1", "GROUP2", "GROUP3")}
+
+    ingestor = db_inserter.MachoundIngestor(NEO4J_URL, NEO4J_AUTH)
+    with ingestor.driver.session() as db_session:
+        for label, names in (("Computer", ("MAC1", "MAC2")), ("User", ("USER1", "USER2", "USER3", "USER4")), ("Group", ("GROUP1", "GROUP2", "GROUP3"))):
+            db_session.run(CREATE_NODES.format(**{"label":label}), sids=[sids[name] for name in names]).consume()
+        db_session.run(CREATE_MEMBER_OF, pairs=[[sids["USER1"], sids["GROUP1"]], [sids["GROUP1"], sids["GROUP2"]],
+                                                [sids["GROUP2"], sids["GROUP3"]], [sids["USER2"], sids["GROUP2"]]]).consume()
+    try:
+        yield ingestor, sids
+    finally:
+        with ingestor.driver.session() as db_session:
+            db_session.run(DELETE_TEST_NODES, prefix=prefix).consume()
+        ingestor.close_session()
+
+def get_edge_sources(ingestor, computer_sid, edge_type):
+    with ingestor.driver.session() as db_session:
+        return {record["sid"] for record in db_session.run(GET_EDGE_SOURCES.format(**{"edge_type":edge_type}), computer_sid=computer_sid)}
+
+def snapshot(sids):
+    return {"Properties": {"objectid": sids["MAC1"], "name": "MAC1"}, "Epoch": 1000, "Sequence": 1, "Hash": "H1",
+            "Sessions": [sids["USER4"]],
+            "AdminGroups": {"AdminTo": [{"MemberId": sids["GROUP2"], "MemberType": "Group"}],
+                            "CanSSH": [{"MemberId": sids["USER3"], "MemberType": "User"}],
+                            "CanVNC": [], "CanAE": []}}
+
+def test_precompute_effective_access(graph):
+
+    ingestor, sids = graph
+    ingestor.parse_json(snapshot(sids))
+    assert ingestor.changed_computers == {sids["MAC1"]}
+
+    ingestor.precompute_effective_access()
+
+    # Members of GROUP2, directly or through GROUP1, get the access. Members of GROUP3 (which GROUP2 belongs to) do not
+    assert get_edge_sources(ingestor, sids["MAC1"], "AdminTo") == {sids["GROUP2"]}
+    assert get_edge_sources(ingestor, sids["MAC1"], "EffectiveAdminTo") == {sids["USER1"], sids["USER2"]}
+    assert get_edge_sources(ingestor, sids["MAC1"], "EffectiveCanSSH") == {sids["USER3"]}
+    assert get_edge_sources(ingestor, sids["MAC2"], "EffectiveAdminTo") == set()
+
+    # The delta is applied on top of the snapshot, and only the changed computer is refreshed
+    ingestor.changed_computers.clear()
+    ingestor.parse_json({"Properties": {"objectid": sids["MAC1"], "name": "MAC1"},
+                         "Delta": {"Epoch": 1000, "Sequence": 2, "BaseHash": "H1", "Hash": "H2",
+                                   "Added": {"AdminGroups": {"AdminTo": [{"MemberId": sids["USER4"], "MemberType": "User"}]}},
+                                   "Removed": {"AdminGroups": {"CanSSH": [{"MemberId": sids["USER3"], "MemberType": "User"}]}}}})
+    assert ingestor.resync_hosts == []
+    ingestor.precompute_effective_access()
+
+    assert get_edge_sources(ingestor, sids["MAC1"], "EffectiveAdminTo") == {sids["USER1"], sids["USER2"], sids["USER4"]}
+    assert get_edge_sources(ingestor, sids["MAC1"], "EffectiveCanSSH") == set()
+
+    # A group membership change is only picked up by a full refresh, paged one computer at a time
+    with ingestor.driver.session() as db_session:
+        db_session.run(DELETE_MEMBER_OF, member_sid=sids["USER1"], group_sid=sids["GROUP1"]).consume()
+    ingestor.changed_computers.clear()
+    ingestor.precompute_effective_access()
+    assert get_edge_sources(ingestor, sids["MAC1"], "EffectiveAdminTo") == {sids["USER1"], sids["USER2"], sids["USER4"]}
+
+    ingestor.precompute_effective_access(only_changed = False, batch_size = 1)
+    assert get_edge_sources(ingestor, sids["MAC1"], "EffectiveAdminTo") == {sids["USER2"], sids["USER4"]}
+
+@pytest.mark.skipif(not NEO4J_IMPORT_DIR, reason="MACHOUND_TEST_NEO4J_IMPORT_DIR is not set")
+def test_load_csv_script(graph, tmp_path):
+
+    ingestor, sids = graph
+    (tmp_path / "mac1.json").write_text(json.dumps(snapshot(sids)))
+
+    # The CSV files are written in a sub folder of the import folder, the URL is relative to the import folder
+    export_folder = "machound-" + uuid.uuid4().hex
+    db_inserter.export_csv(str(tmp_path), os.path.join(NEO4J_IMPORT_DIR, export_folder), csv_url_prefix = "file:///" + export_folder + "/", rows_per_tx = 1)
+
+    with open(os.path.join(NEO4J_IMPORT_DIR, export_folder, db_inserter.CSV_LOAD_SCRIPT_NAME), 'r') as fp:
+        statements = [statement.strip() for statement in fp.read().split(";\n") if statement.strip()]
+
+    with ingestor.driver.session() as db_session:
+        for statement in statements:
+            db_session.run(statement).consume()
+        assert db_session.run(GET_MACHOUND_MARK, computer_sid=sids["MAC1"]).single()["machound"] is True
+
+    assert get_edge_sources(ingestor, sids["MAC1"], "AdminTo") == {sids["GROUP2"]}
+    assert get_edge_sources(ingestor, sids["MAC1"], "CanSSH") == {sids["USER3"]}
+    with ingestor.driver.session() as db_session:
+        sessions = {record["sid"] for record in db_session.run(GET_SESSION_TARGETS, computer_sid=sids["MAC1"])}
+    assert sessions == {sids["USER4"]}
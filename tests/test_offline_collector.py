@@ -0,0 +1,192 @@
+'''
+    This file is part of MacHound.
+
+    MacHound is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MacHound is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MacHound.  If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import os
+import io
+import json
+import tarfile
+import plistlib
+import logging
+import pytest
+import OfflineCollector
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "offline")
+MAPPING_PATHS = [os.path.join(FIXTURE_PATH, file_name) for file_name in ("mapping.csv", "mapping_plain.json", "bloodhound_computers.json")]
+
+ALICE_GUID = "AAAAAAAA-1111-2222-3333-444444444444"
+BOB_GUID = "BBBBBBBB-1111-2222-3333-444444444444"
+ADMINS_GUID = "CCCCCCCC-1111-2222-3333-444444444444"
+
+def add_plist(tar, member_name, content):
+    data = plistlib.dumps(content, fmt=plistlib.FMT_BINARY)
+    member = tarfile.TarInfo(member_name)
+    member.size = len(data)
+    tar.addfile(member, io.BytesIO(data))
+
+def build_archive(archive_path, node_prefixes, mode = "w:gz"):
+
+    '''
+     Build a dslocal archive holding a users and groups folder under each node prefix.
+     Only the Default node has the admin group holding the mapped members.
+    '''
+
+    with tarfile.open(archive_path, mode) as tar:
+        for node_prefix in node_prefixes:
+            is_default = node_prefix.rstrip("/").endswith("Default")
+            add_plist(tar, node_prefix + "users/alice.plist", {"name": ["alice"], "generateduid": [ALICE_GUID],
+                                                               "original_node_name": ["/Active Directory/CORP/All Domains"]})
+            add_plist(tar, node_prefix + "groups/admin.plist", {"name": ["admin"], "generateduid": ["LOCAL-ADMIN"],
+                                                                "groupmembers": [ALICE_GUID, BOB_GUID] if is_default else [],
+                                                                "nestedgroups": [ADMINS_GUID] if is_default else []})
+            add_plist(tar, node_prefix + "groups/README.txt.plist.bak", {})
+    return str(archive_path)
+
+@pytest.fixture
+def mapping():
+    return OfflineCollector.load_mapping(MAPPING_PATHS)
+
+def test_load_mapping_csv():
+
+    guid_to_sid, name_to_sid = OfflineCollector.load_mapping([MAPPING_PATHS[0]])
+
+    # Header names are matched case insensitively and braced lower case GUIDs are normalized
+    assert guid_to_sid == {ALICE_GUID: "S-1-5-21-1-2-3-2001", BOB_GUID: "S-1-5-21-1-2-3-2002"}
+    assert name_to_sid == {"ALICE@CORP.LOCAL": "S-1-5-21-1-2-3-2001", "MAC1.CORP.LOCAL": "S-1-5-21-1-2-3-1001"}
+
+def test_load_mapping_plain_json():
+
+    guid_to_sid, name_to_sid = OfflineCollector.load_mapping([MAPPING_PATHS[1]])
+    assert guid_to_sid == {ADMINS_GUID: "S-1-5-21-1-2-3-512", "DDDDDDDD-1111-2222-3333-444444444444": "S-1-5-21-1-2-3-2004"}
+    assert name_to_sid == {}
+
+def test_load_mapping_bloodhound_export():
+
+    guid_to_sid, name_to_sid = OfflineCollector.load_mapping([MAPPING_PATHS[2]])
+    assert guid_to_sid == {"EEEEEEEE-1111-2222-3333-444444444444": "S-1-5-21-1-2-3-1002"}
+    assert name_to_sid == {"MAC2.CORP.LOCAL": "S-1-5-21-1-2-3-1002",
+                           "MAC3.CORP.LOCAL": "S-1-5-21-1-2-3-1003",
+                           "LAB.EU.CORP.LOCAL": "S-1-5-21-1-2-3-1004",
+                           "LAB.US.CORP.LOCAL": "S-1-5-21-1-2-3-1005"}
+
+def test_load_mapping_merges_files(mapping):
+
+    guid_to_sid, name_to_sid = mapping
+    assert 5 == len(guid_to_sid)
+    assert 6 == len(name_to_sid)
+
+@pytest.mark.parametrize("host_name, properties", [
+    ("MAC2.CORP.LOCAL", {"objectid": "S-1-5-21-1-2-3-1002", "name": "MAC2.CORP.LOCAL"}),
+    ("mac2.corp.local", {"objectid": "S-1-5-21-1-2-3-1002", "name": "MAC2.CORP.LOCAL"}),
+    # Archives named after the short host name get the FQDN stored by BloodHound
+    ("mac3", {"objectid": "S-1-5-21-1-2-3-1003", "name": "MAC3.CORP.LOCAL"}),
+])
+def test_get_host_properties(mapping, host_name, properties):
+
+    assert OfflineCollector.get_host_properties(host_name, mapping[1]) == properties
+
+@pytest.mark.parametrize("host_name", ["lab", "mac9", "mac"])
+def test_get_host_properties_fails_on_unknown_or_ambiguous_host(mapping, host_name):
+
+    with pytest.raises(ValueError):
+        OfflineCollector.get_host_properties(host_name, mapping[1])
+
+@pytest.mark.parametrize("source_name, host_name", [
+    ("mac1.corp.local.tar.gz", "mac1.corp.local"),
+    ("MAC1.TGZ", "MAC1"),
+    ("mac1.corp.local", "mac1.corp.local"),
+    ("mac1/", "mac1"),
+])
+def test_get_host_name(source_name, host_name):
+
+    assert OfflineCollector.get_host_name(source_name) == host_name
+
+@pytest.mark.parametrize("node_prefixes", [
+    ["./private/var/db/dslocal/nodes/Default/"],
+    ["var/db/dslocal/nodes/Default/"],
+    ["dslocal/nodes/Default/"],
+    # The Default node is preferred over the other nodes, whatever the archive order
+    ["./var/db/dslocal/nodes/Contact/", "./var/db/dslocal/nodes/Default/", "./var/db/dslocal/nodes/Search/"],
+])
+def test_archive_node_prefix(tmp_path, mapping, node_prefixes):
+
+    archive_path = build_archive(tmp_path / "mac1.tar.gz", node_prefixes)
+    group_parser = OfflineCollector.ArchiveGroupParser(archive_path, OfflineCollector.MappingSystemLib(mapping[0]))
+
+    admin_group = group_parser.get_group_by_name("admin")
+    assert admin_group.members == (ALICE_GUID, BOB_GUID)
+    assert group_parser.get_user_by_guid(ALICE_GUID).is_mobile
+
+    members = group_parser.get_all_group_members(admin_group)
+    assert {(member.member_id, member.member_type.value) for member in members['activedirectory_sids']} == \
+           {("S-1-5-21-1-2-3-2001", "User"), ("S-1-5-21-1-2-3-2002", "User"), ("S-1-5-21-1-2-3-512", "Group")}
+
+class StreamOnly(io.RawIOBase):
+
+    # Non seekable file, as read from a pipe. Only a streaming tar reader can read it
+    def __init__(self, fp):
+        self._fp = fp
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._fp.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def test_archive_is_read_as_a_stream(tmp_path, mapping, monkeypatch):
+
+    archive_path = build_archive(tmp_path / "mac1.tar.bz2", ["./var/db/dslocal/nodes/Default/"], mode = "w:bz2")
+    archive_file = open(archive_path, 'rb')
+    tarfile_open = tarfile.open
+    monkeypatch.setattr(tarfile, "open", lambda name, mode: tarfile_open(fileobj = StreamOnly(archive_file), mode = mode))
+
+    try:
+        group_parser = OfflineCollector.ArchiveGroupParser(archive_path, OfflineCollector.MappingSystemLib(mapping[0]))
+    finally:
+        archive_file.close()
+
+    assert sorted(group_parser._groups_dict) == ["admin"]
+    assert sorted(group_parser._users_dict) == ["alice"]
+
+def test_archive_without_scheme_fails(tmp_path, mapping):
+
+    archive_path = tmp_path / "empty.tar"
+    with tarfile.open(str(archive_path), "w") as tar:
+        add_plist(tar, "Library/Preferences/com.apple.loginwindow.plist", {})
+
+    with pytest.raises(ValueError):
+        OfflineCollector.ArchiveGroupParser(str(archive_path), OfflineCollector.MappingSystemLib(mapping[0]))
+
+def test_run_batch_fails_unmapped_hosts(tmp_path, caplog):
+
+    build_archive(tmp_path / "mac3.tar.gz", ["./var/db/dslocal/nodes/Default/"])
+    build_archive(tmp_path / "mac9.tar.gz", ["./var/db/dslocal/nodes/Default/"])
+    output_path = str(tmp_path / "batch.ndjson")
+
+    with caplog.at_level(logging.INFO):
+        OfflineCollector.run_batch([str(tmp_path / "mac3.tar.gz"), str(tmp_path / "mac9.tar.gz")], MAPPING_PATHS, output_path,
+                                   ["HasSession", "AdminTo"], workers = 1)
+
+    with open(output_path, 'r') as fp:
+        outputs = [json.loads(line) for line in fp]
+    assert [output['Properties'] for output in outputs] == [{"objectid": "S-1-5-21-1-2-3-1003", "name": "MAC3.CORP.LOCAL"}]
+    assert 'Sessions' not in outputs[0]
+
+    assert "1 hosts collected, 1 failed" in caplog.text
+    assert "Failed hosts: {0}".format(tmp_path / "mac9.tar.gz") in caplog.text